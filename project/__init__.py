@@ -2,5 +2,7 @@ from project.rfa import *
 from project.ecfg import *
 from project.finite_automata_utils import *
 from project.cfg_utils import *
+from project.cfpq_index import *
 from project.graph_utils import *
+from project.automaton_plan import *
 from project.interpreter import *
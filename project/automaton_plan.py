@@ -0,0 +1,340 @@
+import networkx as nx
+from pyformlang.finite_automaton import *
+from pyformlang.regular_expression import *
+
+import project.finite_automata_utils as fau
+import project.graph_utils as gu
+
+
+class AutomatonPlan:
+    """
+    Represents node of the logical plan of an automaton expression.
+    The automaton is built only when its value is observed and is shared by all the expressions using the node
+    """
+
+    def __init__(self):
+        self._fa = None
+        self._decomposition = None
+
+    def regex(self) -> str:
+        """
+        Returns regexp describing the automaton if the expression consists of symbols only, otherwise None
+        """
+        return None
+
+    def source(self) -> tuple:
+        """
+        Returns triple [graph index - start vertices - final vertices] if the expression is a loaded graph
+        with changed start or final vertices, otherwise None. None start or final vertices mean all vertices
+        """
+        return None
+
+    def build(self) -> EpsilonNFA:
+        """
+        Builds the automaton of the expression
+        """
+        raise NotImplementedError
+
+    def to_fa(self) -> EpsilonNFA:
+        """
+        Returns the automaton of the expression building it on the first call
+        """
+        if self._fa is None:
+            self._fa = self.build()
+        return self._fa
+
+    def build_decomposition(self) -> fau.BoolDecomposition:
+        """
+        Builds boolean decomposition of the automaton of the expression
+        """
+        source = self.source()
+        if source is not None:
+            index, start, final = source
+            return index.decomposition.with_start_final(start, final)
+        return fau.BoolDecomposition.from_fa(self.to_fa())
+
+    def decomposition(self) -> fau.BoolDecomposition:
+        """
+        Returns boolean decomposition of the automaton building it on the first call
+        """
+        if self._decomposition is None:
+            self._decomposition = self.build_decomposition()
+        return self._decomposition
+
+    def get_start(self) -> set:
+        """
+        Start states of the automaton
+        """
+        return set(self.to_fa().start_states)
+
+    def get_final(self) -> set:
+        """
+        Final states of the automaton
+        """
+        return set(self.to_fa().final_states)
+
+    def get_vertices(self) -> set:
+        """
+        States of the automaton
+        """
+        return set(self.to_fa().states)
+
+    def get_edges(self) -> set:
+        """
+        Transitions of the automaton as triples [state - symbol - state]
+        """
+        return set(self.to_fa())
+
+    def get_labels(self) -> set:
+        """
+        Symbols of the automaton
+        """
+        return set(self.to_fa().symbols)
+
+    def get_reachable(self) -> fau.ReachablePairs:
+        """
+        Pairs [start state - final state] connected by a path in the automaton
+        """
+        return fau.reachable_pairs(self.decomposition())
+
+    def __iter__(self):
+        # Transitions of the automaton as triples [state - symbol - state], so map and filter work over it
+        return iter(self.to_fa())
+
+    def __getattr__(self, name):
+        # Lambdas may use attributes of the automaton itself
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.to_fa(), name)
+
+
+class LoadPlan(AutomatonPlan):
+    """
+    Graph from the local file or from the dataset with all its vertices being start and final
+    """
+
+    def __init__(self, name: str):
+        super().__init__()
+        self.name = name
+        self._index = None
+
+    @property
+    def index(self) -> fau.GraphIndex:
+        """
+        Index of the loaded graph, the graph is taken from the graph store on the first access
+        """
+        if self._index is None:
+            self._index = gu.graph_store.get(self.name)
+        return self._index
+
+    @property
+    def graph(self) -> nx.MultiDiGraph:
+        """
+        Loaded graph
+        """
+        return self.index.graph
+
+    def source(self) -> tuple:
+        return self.index, None, None
+
+    def build(self) -> EpsilonNFA:
+        return fau.build_NDFA_from_graph(self.graph)
+
+    def get_start(self) -> set:
+        return self.get_vertices()
+
+    def get_final(self) -> set:
+        return self.get_vertices()
+
+    def get_vertices(self) -> set:
+        return {State(v) for v in self.graph.nodes}
+
+    def get_labels(self) -> set:
+        return {Symbol(label) for _, _, label in self.graph.edges(data="label")}
+
+
+class SymbolPlan(AutomatonPlan):
+    """
+    Automaton accepting the single symbol
+    """
+
+    def __init__(self, symbol: str):
+        super().__init__()
+        self.symbol = symbol
+
+    def regex(self) -> str:
+        return self.symbol
+
+    def build(self) -> EpsilonNFA:
+        return Regex(self.symbol).to_epsilon_nfa()
+
+
+class ConcatPlan(AutomatonPlan):
+    """
+    Concatenation of two automata
+    """
+
+    def __init__(self, left: AutomatonPlan, right: AutomatonPlan):
+        super().__init__()
+        self.left = left
+        self.right = right
+
+    def regex(self) -> str:
+        left, right = self.left.regex(), self.right.regex()
+        if left is None or right is None:
+            return None
+        return f"({left}) ({right})"
+
+    def build(self) -> EpsilonNFA:
+        return self.left.to_fa().concatenate(self.right.to_fa())
+
+
+class UnionPlan(AutomatonPlan):
+    """
+    Union of two automata
+    """
+
+    def __init__(self, left: AutomatonPlan, right: AutomatonPlan):
+        super().__init__()
+        self.left = left
+        self.right = right
+
+    def regex(self) -> str:
+        left, right = self.left.regex(), self.right.regex()
+        if left is None or right is None:
+            return None
+        return f"({left})|({right})"
+
+    def build(self) -> EpsilonNFA:
+        return self.left.to_fa().union(self.right.to_fa())
+
+
+class StarPlan(AutomatonPlan):
+    """
+    Kleene star of the automaton
+    """
+
+    def __init__(self, child: AutomatonPlan):
+        super().__init__()
+        self.child = child
+
+    def regex(self) -> str:
+        child = self.child.regex()
+        return f"({child})*" if child is not None else None
+
+    def build(self) -> EpsilonNFA:
+        return self.child.to_fa().kleene_star()
+
+
+class IntersectPlan(AutomatonPlan):
+    """
+    Intersection of two automata, its states are pairs [left state - right state]. Intersection of a loaded graph
+    with a symbols-only expression is fused into one BFS from the start vertices of the graph
+    """
+
+    def __init__(self, left: AutomatonPlan, right: AutomatonPlan):
+        super().__init__()
+        self.left = left
+        self.right = right
+
+    def fused(self) -> tuple:
+        """
+        Returns quadruple [graph index - start vertices - final vertices - regexp] if the intersection
+        can be computed by a BFS over the graph, otherwise None
+        """
+        for graph_plan, regex_plan in (
+            (self.left, self.right),
+            (self.right, self.left),
+        ):
+            source, regex = graph_plan.source(), regex_plan.regex()
+            if source is not None and regex is not None:
+                return *source, regex
+        return None
+
+    def build(self) -> EpsilonNFA:
+        if self.fused() is not None:
+            return self.decomposition().to_fa()
+        return fau.intersect_FA(self.left.to_fa(), self.right.to_fa())
+
+    def build_decomposition(self) -> fau.BoolDecomposition:
+        fused = self.fused()
+        if fused is None:
+            return super().build_decomposition()
+        d = fau.intersect_graph_with_regexp(*fused, decomposition=True)
+        if self.left.regex() is None:
+            return d
+        # The regexp is the left operand, states are pairs [regexp state - vertex] as in the unfused intersection
+        return fau.BoolDecomposition(
+            [State(s.value[::-1]) for s in d.states], d.matrices, d.start, d.final
+        )
+
+    def get_start(self) -> set:
+        if self.fused() is None:
+            return super().get_start()
+        d = self.decomposition()
+        return {d.states[i] for i in d.start}
+
+    def get_final(self) -> set:
+        if self.fused() is None:
+            return super().get_final()
+        d = self.decomposition()
+        return {d.states[i] for i in d.final}
+
+    def get_vertices(self) -> set:
+        if self.fused() is None:
+            return super().get_vertices()
+        return set(self.decomposition().states)
+
+
+class StartFinalPlan(AutomatonPlan):
+    """
+    Automaton with start or final states replaced or extended by the operation
+    """
+
+    OPERATIONS = {"set_start", "set_final", "add_start", "add_final"}
+
+    def __init__(self, child: AutomatonPlan, op: str, operand: set):
+        super().__init__()
+        if op not in StartFinalPlan.OPERATIONS:
+            raise Exception(f'Unknown operation "{op}"')
+        self.child = child
+        self.op = op
+        self.operand = operand
+
+    def source(self) -> tuple:
+        source = self.child.source()
+        if source is None:
+            return None
+        index, start, final = source
+        nodes = index.graph.nodes
+        if self.op == "set_start":
+            start = self.operand
+        elif self.op == "set_final":
+            final = self.operand
+        elif self.op == "add_start":
+            start = (set(nodes) if start is None else start) | self.operand
+        else:
+            final = (set(nodes) if final is None else final) | self.operand
+        return index, start, final
+
+    def build(self) -> EpsilonNFA:
+        result = self.child.to_fa().copy()
+        states = result.start_states if "start" in self.op else result.final_states
+        if self.op.startswith("set"):
+            states.clear()
+        states.update(self.operand)
+        return result
+
+    def get_start(self) -> set:
+        if self.op == "set_start":
+            return set(self.operand)
+        if self.op == "add_start":
+            return self.child.get_start() | self.operand
+        return self.child.get_start()
+
+    def get_final(self) -> set:
+        if self.op == "set_final":
+            return set(self.operand)
+        if self.op == "add_final":
+            return self.child.get_final() | self.operand
+        return self.child.get_final()
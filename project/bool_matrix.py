@@ -0,0 +1,252 @@
+import numpy as np
+from scipy.sparse import *
+
+DENSITY_THRESHOLD = 0.1
+
+
+class BoolMatrixBackend:
+    """
+    Represents set of operations over boolean matrices of some format
+    """
+
+    name = None
+
+    @staticmethod
+    def from_sparse(m):
+        """
+        Converts scipy sparse matrix to the backend format
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def to_sparse(m) -> csr_matrix:
+        """
+        Converts matrix in the backend format to scipy CSR matrix
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def zeros(shape: tuple):
+        """
+        Creates matrix of the given shape filled with False
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def multiply(a, b):
+        """
+        Boolean matrix product of a and b
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def add(a, b):
+        """
+        Elementwise disjunction of a and b
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def difference(a, b):
+        """
+        Elementwise a and not b
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def kron(a, b):
+        """
+        Kronecker product of a and b
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def transpose(a):
+        """
+        Transposed a
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def nnz(a) -> int:
+        """
+        Number of True cells in a
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def equal(a, b) -> bool:
+        """
+        Checks whether a and b have the same shape and the same True cells
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def density(cls, m) -> float:
+        """
+        Share of True cells in the matrix
+        """
+        size = m.shape[0] * m.shape[1]
+        return cls.nnz(m) / size if size != 0 else 0.0
+
+    @classmethod
+    def convert(cls, m, source):
+        """
+        Converts matrix from the source backend format to the current one
+        """
+        if source is cls:
+            return m
+        return cls.from_sparse(source.to_sparse(m))
+
+
+class SparseBackend(BoolMatrixBackend):
+    """
+    Boolean matrices stored as scipy CSR matrices
+    """
+
+    name = "sparse"
+
+    @staticmethod
+    def from_sparse(m):
+        return csr_matrix(m, dtype=bool)
+
+    @staticmethod
+    def to_sparse(m) -> csr_matrix:
+        return m
+
+    @staticmethod
+    def zeros(shape: tuple):
+        return csr_matrix(shape, dtype=bool)
+
+    @staticmethod
+    def multiply(a, b):
+        return a @ b
+
+    @staticmethod
+    def add(a, b):
+        return a + b
+
+    @staticmethod
+    def difference(a, b):
+        return a > b
+
+    @staticmethod
+    def kron(a, b):
+        return kron(a, b, format="csr")
+
+    @staticmethod
+    def transpose(a):
+        return a.transpose().tocsr()
+
+    @staticmethod
+    def nnz(a) -> int:
+        return a.nnz
+
+    @staticmethod
+    def equal(a, b) -> bool:
+        return a.shape == b.shape and (a != b).nnz == 0
+
+
+class BitMatrix:
+    """
+    Represents dense boolean matrix with every row packed into 64-bit words
+    """
+
+    __slots__ = ("words", "shape")
+
+    def __init__(self, words: np.ndarray, shape: tuple):
+        """
+        :param words: Array of shape [rows - words per row] with dtype uint64
+        :param shape: Shape of the matrix
+        """
+        self.words = words
+        self.shape = shape
+
+    @staticmethod
+    def pack(dense: np.ndarray):
+        """
+        Packs dense boolean array into BitMatrix
+        """
+        rows, cols = dense.shape
+        padded = np.zeros((rows, -(-cols // 64) * 64), dtype=bool)
+        padded[:, :cols] = dense
+        words = np.packbits(padded, axis=1, bitorder="little").view(np.uint64)
+        return BitMatrix(words.reshape(rows, -1), (rows, cols))
+
+    def unpack(self) -> np.ndarray:
+        """
+        Unpacks BitMatrix into dense boolean array
+        """
+        bits = np.unpackbits(self.words.view(np.uint8), axis=1, bitorder="little")
+        return bits[:, : self.shape[1]].astype(bool)
+
+
+class BitPackedBackend(BoolMatrixBackend):
+    """
+    Boolean matrices stored as dense arrays of bit-packed rows
+    """
+
+    name = "bitpacked"
+
+    @staticmethod
+    def from_sparse(m):
+        return BitMatrix.pack(m.toarray().astype(bool))
+
+    @staticmethod
+    def to_sparse(m) -> csr_matrix:
+        return csr_matrix(m.unpack())
+
+    @staticmethod
+    def zeros(shape: tuple):
+        return BitMatrix(np.zeros((shape[0], -(-shape[1] // 64)), np.uint64), shape)
+
+    @staticmethod
+    def multiply(a, b):
+        words = np.zeros((a.shape[0], b.words.shape[1]), dtype=np.uint64)
+        dense = a.unpack()
+        for j in np.flatnonzero(dense.any(axis=0)):
+            words[dense[:, j]] |= b.words[j]
+        return BitMatrix(words, (a.shape[0], b.shape[1]))
+
+    @staticmethod
+    def add(a, b):
+        return BitMatrix(a.words | b.words, a.shape)
+
+    @staticmethod
+    def difference(a, b):
+        return BitMatrix(a.words & ~b.words, a.shape)
+
+    @staticmethod
+    def kron(a, b):
+        return BitMatrix.pack(np.kron(a.unpack(), b.unpack()))
+
+    @staticmethod
+    def transpose(a):
+        return BitMatrix.pack(a.unpack().T)
+
+    @staticmethod
+    def nnz(a) -> int:
+        return int(np.unpackbits(a.words.view(np.uint8)).sum())
+
+    @staticmethod
+    def equal(a, b) -> bool:
+        return a.shape == b.shape and np.array_equal(a.words, b.words)
+
+
+BACKENDS = {b.name: b for b in (SparseBackend, BitPackedBackend)}
+
+
+def get_backend(backend="sparse", density: float = 0.0):
+    """
+    Returns boolean matrix backend
+    :param backend: Backend name, backend class or "auto"
+    :param density: Share of True cells in the processed matrices. Used to pick the backend if backend is "auto"
+    :return: Backend class
+    """
+    if backend == "auto":
+        return BitPackedBackend if density >= DENSITY_THRESHOLD else SparseBackend
+    if isinstance(backend, str):
+        if backend not in BACKENDS:
+            raise Exception(f'Unknown boolean matrix backend "{backend}"')
+        return BACKENDS[backend]
+    return backend
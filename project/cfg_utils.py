@@ -1,8 +1,16 @@
-from collections import defaultdict
-from copy import deepcopy
+import hashlib
+import os
+import pickle
+import tempfile
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
 from pyformlang.cfg import *
 from scipy.sparse import *
 import networkx as nx
+import numpy as np
+
+from project.bool_matrix import SparseBackend, get_backend
+from project.ecfg import ECFG
 
 
 def read_cfg_from_file(path: str) -> CFG:
@@ -15,9 +23,92 @@ def read_cfg_from_file(path: str) -> CFG:
         return CFG.from_text(file.read())
 
 
+def grammar_fingerprint(cfg: CFG) -> str:
+    """
+    Returns fingerprint of the CFG that does not depend on the order of productions
+    :param cfg: CFG to fingerprint
+    :return: Hex digest identifying the start symbol and the set of productions
+    """
+    productions = sorted(
+        " ".join(f"{type(o).__name__}:{o.value}" for o in (p.head, *p.body))
+        for p in cfg.productions
+    )
+    text = "\n".join(
+        [f"Start:{getattr(cfg.start_symbol, 'value', None)}", *productions]
+    )
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class WCNFCache:
+    """
+    Represents LRU cache of grammars converted to Weak Normal Chomsky Form with optional on-disk store
+    """
+
+    def __init__(self, maxsize: int = 128, path: str = None):
+        """
+        :param maxsize: Maximal number of grammars kept in memory
+        :param path: Directory of the on-disk store. If None - grammars are kept only in memory
+        """
+        self.maxsize = maxsize
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._grammars = OrderedDict()
+
+    def get(self, cfg: CFG) -> CFG:
+        """
+        Returns CFG in Weak Normal Chomsky Form equivalent to the original, converting it only if it is not cached
+        """
+        key = grammar_fingerprint(cfg)
+
+        if key in self._grammars:
+            self.hits += 1
+            self._grammars.move_to_end(key)
+            return self._grammars[key]
+
+        file = os.path.join(self.path, key + ".pickle") if self.path else None
+        if file is not None and os.path.isfile(file):
+            self.hits += 1
+            with open(file, "rb") as f:
+                result = pickle.load(f)
+        else:
+            self.misses += 1
+            result = _to_wcnf(cfg)
+            if file is not None:
+                os.makedirs(self.path, exist_ok=True)
+                with tempfile.NamedTemporaryFile(
+                    "wb", dir=self.path, delete=False
+                ) as f:
+                    pickle.dump(result, f)
+                os.replace(f.name, file)
+
+        self._grammars[key] = result
+        if len(self._grammars) > self.maxsize:
+            self._grammars.popitem(last=False)
+        return result
+
+    def clear(self):
+        """
+        Removes all grammars from memory. The on-disk store is kept
+        """
+        self._grammars.clear()
+
+
+wcnf_cache = WCNFCache()
+
+
 def to_wcnf(cfg: CFG) -> CFG:
     """
-    Returns CFG in Weak Normal Chomsky Form that is equivalent to the original
+    Returns CFG in Weak Normal Chomsky Form that is equivalent to the original. Results are cached in wcnf_cache
+    :param cfg: original CFG
+    :return: CFG equivalent to the original but in Weak Normal Chomsky Form
+    """
+    return wcnf_cache.get(cfg)
+
+
+def _to_wcnf(cfg: CFG) -> CFG:
+    """
+    Converts CFG to Weak Normal Chomsky Form
     :param cfg: original CFG
     :return: CFG equivalent to the original but in Weak Normal Chomsky Form
     """
@@ -29,59 +120,343 @@ def to_wcnf(cfg: CFG) -> CFG:
     return CFG(start_symbol=cfg.start_symbol, productions=prods)
 
 
-def matrix_alg(graph: nx.DiGraph, cfg: CFG):
+def _index_nodes(graph: nx.DiGraph) -> dict:
     """
-    Matrix algorithm for all nodes reachability
+    Maps graph nodes to dense matrix indices
+    :param graph: graph to index
+    :return: Dict of pairs [node - index] in the order of graph.nodes
     """
+    return {v: i for i, v in enumerate(graph.nodes)}
 
-    cfg = to_wcnf(cfg)
-
-    edges = defaultdict(set)
 
+def _edges_by_label(graph: nx.DiGraph, nodes_index: dict) -> dict:
+    """
+    Groups graph edges by label
+    :param graph: graph to decompose
+    :param nodes_index: Dict of pairs [node - index]
+    :return: Dict of pairs [label - (row indices, column indices)] of the edges with this label
+    """
+    edges = defaultdict(lambda: ([], []))
     for v, u, l in graph.edges.data("label"):
-        edges[l].add((v, u))
+        rows, cols = edges[l]
+        rows.append(nodes_index[v])
+        cols.append(nodes_index[u])
 
-    matrix_size = graph.number_of_nodes()
+    return {
+        l: (np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64))
+        for l, (rows, cols) in edges.items()
+    }
 
-    m0 = defaultdict(lambda: csr_matrix((matrix_size, matrix_size), dtype=bool))
 
+def _bool_matrix(rows: np.ndarray, cols: np.ndarray, size: int) -> csr_matrix:
+    """
+    Builds boolean square matrix with True in the given cells in one pass
+    """
+    return csr_matrix(
+        (np.ones(len(rows), dtype=bool), (rows, cols)), shape=(size, size), dtype=bool
+    )
+
+
+def _initial_matrices(graph: nx.DiGraph, cfg: CFG) -> tuple[dict, defaultdict]:
+    """
+    Builds matrices of the nonterminals derived by terminal and epsilon productions
+    :param graph: graph to run the algorithm on
+    :param cfg: CFG in Weak Normal Chomsky Form
+    :return: Dict of pairs [node - index] and dict of pairs [nonterminal - initial matrix]
+    """
+    nodes_index = _index_nodes(graph)
+    edges = _edges_by_label(graph, nodes_index)
+    matrix_size = len(nodes_index)
+
+    rows = defaultdict(list)
+    cols = defaultdict(list)
     for p in cfg.productions:
         if len(p.body) == 0:
-            for i in range(matrix_size):
-                m0[p.head][i, i] = True
-        if len(p.body) != 1:
-            continue
-        for i, j in edges[p.body[0].value]:
-            m0[p.head][i, j] = True
+            rows[p.head].append(np.arange(matrix_size))
+            cols[p.head].append(np.arange(matrix_size))
+        elif (
+            len(p.body) == 1
+            and isinstance(p.body[0], Terminal)
+            and p.body[0].value in edges
+        ):
+            r, c = edges[p.body[0].value]
+            rows[p.head].append(r)
+            cols[p.head].append(c)
+
+    m0 = defaultdict(lambda: csr_matrix((matrix_size, matrix_size), dtype=bool))
+    for n in rows.keys():
+        m0[n] = _bool_matrix(
+            np.concatenate(rows[n]), np.concatenate(cols[n]), matrix_size
+        )
+
+    return nodes_index, m0
+
+
+def matrix_alg(
+    graph: nx.DiGraph,
+    cfg: CFG,
+    semi_naive: bool = True,
+    backend="sparse",
+    workers: int = 1,
+):
+    """
+    Matrix algorithm for all nodes reachability
+    :param graph: graph to run the algorithm on
+    :param cfg: CFG describing paths
+    :param semi_naive: If True - each iteration multiplies only the pairs found on the previous iteration
+    (deltas) against the accumulated matrices. If False - full matrices are multiplied until nothing changes
+    :param backend: Boolean matrix backend name ("sparse", "bitpacked" or "auto") or class
+    :param workers: Number of threads evaluating the products of one iteration
+    :return: Dict of pairs [nonterminal - reachability matrix], matrices are indexed in the order of graph.nodes
+    """
+    cfg = to_wcnf(cfg)
+
+    _, m0 = _initial_matrices(graph, cfg)
 
-    prev = None
+    binary = [p for p in cfg.productions if len(p.body) == 2]
 
-    def check_bool_dec(m1: dict, m2: dict):
-        if m2.keys() != m1.keys():
-            return False
-        for k in m1.keys():
-            if (m1[k] != m2[k]).sum() != 0:
-                return False
-        return True
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        mapper = pool.map if workers > 1 else map
+        if semi_naive:
+            return _semi_naive_fixpoint(m0, binary, backend, mapper)
+        return _naive_fixpoint(m0, binary, backend, mapper)
+
+
+def _multiply_all(backend, tasks: list, mapper=map) -> dict:
+    """
+    Evaluates products of the matrices and merges them by the head nonterminal
+    :param backend: Boolean matrix backend
+    :param tasks: List of triples [head nonterminal - left matrix - right matrix]
+    :param mapper: map-like function used to evaluate the products
+    :return: Dict of pairs [head nonterminal - disjunction of its products]
+    """
+    products = mapper(lambda t: backend.multiply(t[1], t[2]), tasks)
+
+    result = dict()
+    for (head, _, _), m in zip(tasks, products):
+        result[head] = backend.add(result[head], m) if head in result else m
+    return result
+
+
+def _naive_fixpoint(m0: defaultdict, productions: list, backend, mapper=map) -> dict:
+    """
+    Computes the fixpoint of the matrix algorithm multiplying full matrices until nothing changes
+    :param m0: Dict of pairs [nonterminal - initial matrix]
+    :param productions: Productions with two nonterminals in the body
+    :param backend: Boolean matrix backend. If "auto" - the backend is picked by the density of the initial matrices
+    :param mapper: map-like function used to evaluate the products of one iteration
+    :return: Dict of pairs [nonterminal - reachability matrix]
+    """
+    nonterminals = set(m0.keys()) | {n for p in productions for n in (p.head, *p.body)}
+    backend = get_backend(
+        backend,
+        max((SparseBackend.density(m) for m in m0.values()), default=0.0),
+    )
+    m = {n: backend.from_sparse(m0[n]) for n in nonterminals}
 
     while True:
-        if prev is not None and check_bool_dec(prev, m0):
+        prev = dict(m)
+        new = _multiply_all(
+            backend, [(p.head, m[p.body[0]], m[p.body[1]]) for p in productions], mapper
+        )
+        for n, matr in new.items():
+            m[n] = backend.add(m[n], matr)
+        if all(backend.equal(prev[n], m[n]) for n in nonterminals):
             break
-        prev = deepcopy(m0)
-        for p in cfg.productions:
-            if len(p.body) != 2:
+
+    return {n: backend.to_sparse(matr) for n, matr in m.items()}
+
+
+# Share of the nodes up to which the rows of a nonterminal are computed only for the nodes it is derived from.
+# query_matrix uses multiple_source_matrix_alg for up to this share of start nodes
+MULTIPLE_SOURCE_SHARE = 0.25
+
+
+def multiple_source_matrix_alg(graph: nx.DiGraph, cfg: CFG, start: set) -> dict:
+    """
+    Matrix algorithm for reachability from the start nodes.
+    Rows of the nodes from which a nonterminal has to be derived are added to the semi-naive iterations
+    as the new pairs discover them
+    :param graph: graph to run the algorithm on
+    :param cfg: CFG describing paths
+    :param start: Start nodes
+    :return: Dict of pairs [nonterminal - reachability matrix], matrices are indexed in the order of graph.nodes.
+    Only rows of the nodes from which a nonterminal has to be derived are filled, the start symbol rows are the start nodes
+    """
+    cfg = to_wcnf(cfg)
+
+    nodes_index, m0 = _initial_matrices(graph, cfg)
+    matrix_size = len(nodes_index)
+
+    binary = [p for p in cfg.productions if len(p.body) == 2]
+    nonterminals = set(m0.keys()) | {n for p in binary for n in (p.head, *p.body)}
+    by_head = defaultdict(list)
+    by_first = defaultdict(list)
+    for p in binary:
+        by_head[p.head].append(p)
+        by_first[p.body[0]].append(p)
+
+    # Rows are selected on the CSR arrays, a product with a diagonal matrix costs more than the selection itself
+    def restrict(rows: np.ndarray, m: csr_matrix) -> csr_matrix:
+        lengths = np.diff(m.indptr)
+        keep = np.repeat(rows, lengths)
+        indptr = np.concatenate(([0], np.cumsum(np.where(rows, lengths, 0))))
+        return csr_matrix(
+            (m.data[keep], m.indices[keep], indptr), shape=m.shape, dtype=bool
+        )
+
+    def ends(rows: np.ndarray, m: csr_matrix) -> np.ndarray:
+        result = np.zeros(matrix_size, dtype=bool)
+        result[m.indices[np.repeat(rows, np.diff(m.indptr))]] = True
+        return result
+
+    src = {n: np.zeros(matrix_size, dtype=bool) for n in nonterminals}
+    total = {n: SparseBackend.zeros((matrix_size, matrix_size)) for n in nonterminals}
+
+    def expand(delta: dict, total: dict, required: list = ()) -> dict:
+        # For H -> B C paths of B start from the rows of H, paths of C start where they end
+        added = dict()
+        queue = deque(required)
+        for n, m in delta.items():
+            for p in by_first[n]:
+                queue.append((p.body[1], ends(src[p.head], m)))
+        while len(queue) != 0:
+            n, rows = queue.popleft()
+            rows = rows > src[n]
+            if (src[n] | rows).sum() > MULTIPLE_SOURCE_SHARE * matrix_size:
+                rows = ~src[n]
+            if not rows.any():
                 continue
-            m0[p.head] += m0[p.body[0]] @ m0[p.body[1]]
+            src[n] |= rows
+            leaves = restrict(rows, m0[n]) if n in m0 else None
+            if leaves is not None and leaves.nnz != 0:
+                added[n] = added[n] + leaves if n in added else leaves
+                for p in by_first[n]:
+                    queue.append((p.body[1], ends(src[p.head], leaves)))
+            for p in by_head[n]:
+                b, c = p.body
+                queue.append((b, rows))
+                found = ends(rows, total[b])
+                if b in added:
+                    found |= ends(rows, added[b])
+                queue.append((c, found))
+        return added
+
+    starts = np.zeros(matrix_size, dtype=bool)
+    starts[[nodes_index[v] for v in start if v in nodes_index]] = True
+    delta = expand(dict(), total, [(cfg.start_symbol, starts)])
+    total.update(delta)
+
+    total, _ = propagate_deltas(total, delta, binary, SparseBackend, expand=expand)
+
+    return {n: restrict(src[n], m) for n, m in total.items()}
+
+
+def _semi_naive_fixpoint(
+    m0: defaultdict, productions: list, backend="sparse", mapper=map
+) -> dict:
+    """
+    Computes the fixpoint of the matrix algorithm multiplying only new pairs against the accumulated ones
+    :param m0: Dict of pairs [nonterminal - initial matrix]
+    :param productions: Productions with two nonterminals in the body
+    :param backend: Boolean matrix backend. If "auto" - the backend is picked by the density of the matrices after every iteration
+    :param mapper: map-like function used to evaluate the products of one iteration
+    :return: Dict of pairs [nonterminal - reachability matrix]
+    """
+    nonterminals = set(m0.keys()) | {n for p in productions for n in (p.head, *p.body)}
+
+    current = get_backend(
+        backend,
+        max((SparseBackend.density(m) for m in m0.values()), default=0.0),
+    )
+    total = {n: current.from_sparse(m0[n]) for n in nonterminals}
+    delta = {n: m for n, m in total.items() if current.nnz(m) != 0}
+
+    total, current = propagate_deltas(
+        total, delta, productions, current, backend, mapper
+    )
+
+    return {n: current.to_sparse(m) for n, m in total.items()}
+
+
+def propagate_deltas(
+    total: dict,
+    delta: dict,
+    productions: list,
+    current,
+    backend=None,
+    mapper=map,
+    expand: callable = None,
+) -> tuple[dict, any]:
+    """
+    Adds to the matrices all the pairs derivable with the new pairs
+    :param total: Dict of pairs [nonterminal - matrix], closed under the productions except for the new pairs. Includes the new pairs
+    :param delta: Dict of pairs [nonterminal - matrix of the new pairs]
+    :param productions: Productions with two nonterminals in the body
+    :param current: Boolean matrix backend of the matrices
+    :param backend: Requested boolean matrix backend. If "auto" - the backend is picked by the density of the matrices after every iteration
+    :param mapper: map-like function used to evaluate the products of one iteration
+    :param expand: Function called with the new pairs and the matrices after every iteration, returns dict of pairs
+    [nonterminal - matrix of the pairs] to be added with the new ones. Used with the sparse backend only
+    :return: Closed dict of pairs [nonterminal - matrix] and its backend
+    """
+    total = dict(total)
+
+    while len(delta) != 0:
+        tasks = []
+        for p in productions:
+            b, c = p.body
+            if b in delta:
+                tasks.append((p.head, delta[b], total[c]))
+            if c in delta:
+                tasks.append((p.head, total[b], delta[c]))
+        new = _multiply_all(current, tasks, mapper)
+
+        delta = dict()
+        for n, m in new.items():
+            d = current.difference(m, total[n])
+            if current.nnz(d) != 0:
+                delta[n] = d
+                total[n] = current.add(total[n], d)
+
+        if expand is not None:
+            for n, m in expand(delta, total).items():
+                d = current.difference(m, total[n])
+                if current.nnz(d) != 0:
+                    delta[n] = current.add(delta[n], d) if n in delta else d
+                    total[n] = current.add(total[n], d)
+
+        if backend is None:
+            continue
+        picked = get_backend(
+            backend,
+            max((current.density(m) for m in total.values()), default=0.0),
+        )
+        if picked is not current:
+            total = {n: picked.convert(m, current) for n, m in total.items()}
+            delta = {n: picked.convert(m, current) for n, m in delta.items()}
+            current = picked
 
-    return prev
+    return total, current
 
 
 def query_matrix(
     graph: nx.DiGraph, cfg: CFG, start: set = None, final: set = None, nonterminal=None
 ):
     """
-    Solves reachability problem for graph and CFG for provided start, final nodes and nonterminal symbol
+    Solves reachability problem for graph and CFG for provided start, final nodes and nonterminal symbol.
+    If the start nodes are provided for the start symbol and they are a small share of the nodes,
+    only paths from them are computed
     """
+    if (
+        start is not None
+        and (nonterminal is None or nonterminal == cfg.start_symbol)
+        and len(start) <= MULTIPLE_SOURCE_SHARE * graph.number_of_nodes()
+    ):
+        matrices = multiple_source_matrix_alg(graph, cfg, start)
+    else:
+        matrices = matrix_alg(graph, cfg)
+
     if start is None:
         start = set(graph.nodes)
 
@@ -91,61 +466,70 @@ def query_matrix(
     if nonterminal is None:
         nonterminal = cfg.start_symbol
 
+    nodes = list(graph.nodes)
     result = set()
-    for n, matr in matrix_alg(graph, cfg).items():
+    for n, matr in matrices.items():
+        if n != nonterminal:
+            continue
         for v, u in zip(*matr.nonzero()):
-            if n == nonterminal and v in start and u in final:
-                result.add((v, u))
+            if nodes[v] in start and nodes[u] in final:
+                result.add((nodes[v], nodes[u]))
 
     return result
 
 
-def hellings(graph: nx.DiGraph, cfg: CFG):
+def hellings(graph: nx.DiGraph, cfg: CFG) -> set:
     """
     Hellings algorythm for all nodes reachability
+    :param graph: graph to run the algorithm on
+    :param cfg: CFG describing paths
+    :return: Set of triples [nonterminal - start node - final node]
     """
-    # cfg = cfg.to_normal_form()
     cfg = to_wcnf(cfg)
+
+    by_terminal = defaultdict(set)
+    by_body = defaultdict(set)
     r = set()
     for p in cfg.productions:
         N = p.head
         if len(p.body) == 0:
-            r |= {(N, v, v) for v in graph.nodes.data("label")}
+            r |= {(N, v, v) for v in graph.nodes}
         elif len(p.body) == 1:
             if isinstance(p.body[0], Terminal):
-                r |= {
-                    (N, v, u)
-                    for v, u, s in graph.edges.data("label")
-                    if s == p.body[0].value
-                }
-    r = list(r)
-    m = list(r)
+                by_terminal[p.body[0].value].add(N)
+        elif len(p.body) == 2:
+            by_body[(p.body[0], p.body[1])].add(p.head)
+
+    for v, u, s in graph.edges.data("label"):
+        for N in by_terminal.get(s, ()):
+            r.add((N, v, u))
+
+    incoming = defaultdict(lambda: defaultdict(set))
+    outgoing = defaultdict(lambda: defaultdict(set))
+    for N, v, u in r:
+        outgoing[v][N].add(u)
+        incoming[u][N].add(v)
+
+    m = deque(r)
+
+    def add(N, v, u):
+        if (N, v, u) in r:
+            return
+        r.add((N, v, u))
+        outgoing[v][N].add(u)
+        incoming[u][N].add(v)
+        m.append((N, v, u))
 
     while len(m) != 0:
-        N, v, u = m.pop(0)
-        for N_, v_, u_ in r:
-            if u_ == v:
-                for p in cfg.productions:
-                    if len(p.body) != 2:
-                        continue
-                    if p.body[0] != N_ or p.body[1] != N:
-                        continue
-                    if (p.head, v_, u) in r:
-                        continue
-
-                    m.append((p.head, v_, u))
-                    r.append((p.head, v_, u))
-            if u == v_:
-                for p in cfg.productions:
-                    if len(p.body) != 2:
-                        continue
-                    if p.body[0] != N or p.body[1] != N_:
-                        continue
-                    if (p.head, v, u_) in r:
-                        continue
-
-                    m.append((p.head, v, u_))
-                    r.append((p.head, v, u_))
+        N, v, u = m.popleft()
+        for N_, vs in list(incoming[v].items()):
+            for head in by_body.get((N_, N), ()):
+                for v_ in list(vs):
+                    add(head, v_, u)
+        for N_, us in list(outgoing[u].items()):
+            for head in by_body.get((N, N_), ()):
+                for u_ in list(us):
+                    add(head, v, u_)
 
     return r
 
@@ -171,3 +555,211 @@ def query_hellings(
             result.add((v, u))
 
     return result
+
+
+def _transitive_closure(m: csr_matrix) -> csr_matrix:
+    """
+    Computes transitive closure of the boolean adjacency matrix
+    :param m: adjacency matrix
+    :return: matrix with True for every pair of vertices connected by a non-empty path
+    """
+    m = m.astype(bool)
+    while True:
+        nnz = m.nnz
+        m = (m + m @ m).astype(bool)
+        if m.nnz == nnz:
+            return m
+
+
+def tensor_alg(graph: nx.DiGraph, grammar) -> dict:
+    """
+    Tensor algorithm for all nodes reachability
+    :param graph: graph to run the algorithm on
+    :param grammar: CFG or ECFG describing paths
+    :return: Dict of pairs [nonterminal - reachability matrix], matrices are indexed in the order of graph.nodes
+    """
+    ecfg = grammar if isinstance(grammar, ECFG) else ECFG.from_CFG(grammar)
+    rfa = ecfg.to_rfa().minimize()
+
+    nodes_index = _index_nodes(graph)
+    graph_size = len(nodes_index)
+
+    rfa_m = defaultdict(list)
+    boxes = []
+    offset = 0
+    for nt, d in rfa.to_matrix_form().items():
+        for symb, m in d.matrices.items():
+            rfa_m[symb.value].append((offset, m))
+        boxes.append((nt, d.start + offset, d.final + offset))
+        offset += d.size
+    rfa_size = offset
+
+    def place(blocks: list) -> csr_matrix:
+        rows = np.concatenate([m.nonzero()[0] + o for o, m in blocks])
+        cols = np.concatenate([m.nonzero()[1] + o for o, m in blocks])
+        return _bool_matrix(rows, cols, rfa_size)
+
+    rfa_m = {symb: place(blocks) for symb, blocks in rfa_m.items()}
+
+    graph_m = {
+        l: _bool_matrix(rows, cols, graph_size)
+        for l, (rows, cols) in _edges_by_label(graph, nodes_index).items()
+    }
+
+    for nt, starts, finals in boxes:
+        graph_m[nt.value] = csr_matrix((graph_size, graph_size), dtype=bool)
+        if set(starts) & set(finals):
+            graph_m[nt.value] = eye(graph_size, dtype=bool, format="csr")
+
+    product_size = rfa_size * graph_size
+    changed = True
+    while changed:
+        product = csr_matrix((product_size, product_size), dtype=bool)
+        for l in rfa_m.keys() & graph_m.keys():
+            # kron of an empty operand is float64, keep the product boolean
+            product = product + kron(rfa_m[l], graph_m[l], format="csr").astype(bool)
+        closure = _transitive_closure(product)
+
+        changed = False
+        for nt, starts, finals in boxes:
+            for s in starts:
+                for f in finals:
+                    block = closure[
+                        s * graph_size : (s + 1) * graph_size,
+                        f * graph_size : (f + 1) * graph_size,
+                    ]
+                    new = block > graph_m[nt.value]
+                    if new.nnz != 0:
+                        graph_m[nt.value] = graph_m[nt.value] + new
+                        changed = True
+
+    return {nt: graph_m[nt.value] for nt, _, _ in boxes}
+
+
+def query_tensor(
+    graph: nx.DiGraph,
+    grammar,
+    start: set = None,
+    final: set = None,
+    nonterminal=None,
+):
+    """
+    Solves reachability problem for graph and CFG or ECFG for provided start, final nodes and nonterminal symbol
+    """
+    if start is None:
+        start = set(graph.nodes)
+
+    if final is None:
+        final = set(graph.nodes)
+
+    if nonterminal is None:
+        nonterminal = (
+            grammar.start if isinstance(grammar, ECFG) else grammar.start_symbol
+        )
+
+    nodes = list(graph.nodes)
+    result = set()
+    for n, matr in tensor_alg(graph, grammar).items():
+        if n != nonterminal:
+            continue
+        for v, u in zip(*matr.nonzero()):
+            if nodes[v] in start and nodes[u] in final:
+                result.add((nodes[v], nodes[u]))
+
+    return result
+
+
+def gll(graph: nx.DiGraph, grammar, start: set, nonterminal=None) -> set:
+    """
+    GLL algorithm for reachability from the start nodes
+    :param graph: graph to run the algorithm on
+    :param grammar: CFG or ECFG describing paths
+    :param start: Start nodes
+    :param nonterminal: Nonterminal deriving the paths. If None - the start symbol of the grammar
+    :return: Set of pairs [start node - final node]
+    """
+    ecfg = grammar if isinstance(grammar, ECFG) else ECFG.from_CFG(grammar)
+    if nonterminal is None:
+        nonterminal = ecfg.start
+    rfa = ecfg.to_rfa().minimize()
+
+    box_starts = dict()
+    transitions = defaultdict(list)
+    finals = set()
+    for nt, nfa in rfa.transitions.items():
+        for s in nfa.start_states:
+            box_starts[nt.value] = (nt.value, s)
+        for s in nfa.final_states:
+            finals.add((nt.value, s))
+        for s, symb, f in nfa:
+            transitions[(nt.value, s)].append((symb.value, (nt.value, f)))
+
+    out_edges = dict()
+
+    def successors(v, label):
+        if v not in out_edges:
+            out_edges[v] = defaultdict(list)
+            for _, u, l in graph.out_edges(v, data="label"):
+                out_edges[v][l].append(u)
+        return out_edges[v].get(label, ())
+
+    # GSS nodes are pairs [nonterminal - node the derivation starts from]
+    gss_edges = defaultdict(set)
+    popped = defaultdict(set)
+    descriptors = set()
+    queue = deque()
+
+    def add(state, v, gss):
+        if (state, v, gss) not in descriptors:
+            descriptors.add((state, v, gss))
+            queue.append((state, v, gss))
+
+    def call(n, v):
+        gss = (n, v)
+        if gss not in gss_edges and n in box_starts:
+            gss_edges[gss] = set()
+            add(box_starts[n], v, gss)
+        return gss
+
+    roots = [call(nonterminal, v) for v in start if v in graph]
+
+    while len(queue) != 0:
+        state, v, gss = queue.popleft()
+
+        if state in finals and v not in popped[gss]:
+            popped[gss].add(v)
+            for ret, parent in gss_edges[gss]:
+                add(ret, v, parent)
+
+        for symb, next_state in transitions[state]:
+            # A symbol is a nonterminal if it has a box, graph edges with its name are not followed then
+            if symb in box_starts:
+                callee = call(symb, v)
+                if (next_state, gss) not in gss_edges[callee]:
+                    gss_edges[callee].add((next_state, gss))
+                    for u in list(popped[callee]):
+                        add(next_state, u, gss)
+            else:
+                for u in successors(v, symb):
+                    add(next_state, u, gss)
+
+    return {(root[1], u) for root in roots for u in popped[root]}
+
+
+def query_gll(
+    graph: nx.DiGraph,
+    grammar,
+    start: set = None,
+    final: set = None,
+    nonterminal=None,
+):
+    """
+    Solves reachability problem for graph and CFG or ECFG for provided start, final nodes and nonterminal symbol
+    """
+    if start is None:
+        start = set(graph.nodes)
+
+    if final is None:
+        final = set(graph.nodes)
+
+    return {(v, u) for v, u in gll(graph, grammar, start, nonterminal) if u in final}
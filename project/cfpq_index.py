@@ -0,0 +1,134 @@
+from collections import defaultdict
+
+import networkx as nx
+import numpy as np
+from pyformlang.cfg import CFG, Terminal
+from scipy.sparse import csr_matrix
+
+from project.bool_matrix import SparseBackend
+from project.cfg_utils import to_wcnf, propagate_deltas
+
+
+class CFPQIndex:
+    """
+    Represents context-free reachability in a graph that is updated on edge insertions
+    """
+
+    def __init__(self, graph: nx.DiGraph, cfg: CFG):
+        """
+        :param graph: Initial graph
+        :param cfg: CFG describing paths
+        """
+        self.start_symbol = cfg.start_symbol
+        cfg = to_wcnf(cfg)
+
+        self.productions = [p for p in cfg.productions if len(p.body) == 2]
+        self.by_terminal = defaultdict(set)
+        self.nullable = set()
+        for p in cfg.productions:
+            if len(p.body) == 0:
+                self.nullable.add(p.head)
+            elif len(p.body) == 1 and isinstance(p.body[0], Terminal):
+                self.by_terminal[p.body[0].value].add(p.head)
+
+        self.nodes = []
+        self.nodes_index = dict()
+        self.matrices = {
+            n: csr_matrix((0, 0), dtype=bool)
+            for n in cfg.variables | {self.start_symbol}
+        }
+
+        self.add_nodes(graph.nodes)
+        self.add_edges(graph.edges(data="label"))
+
+    def add_nodes(self, nodes):
+        """
+        Adds nodes to the graph
+        :param nodes: Iterable of nodes
+        """
+        self._update([], nodes)
+
+    def add_edges(self, edges):
+        """
+        Adds edges to the graph and derives all the new reachable pairs
+        :param edges: Iterable of triples [start node - final node - label]
+        """
+        edges = list(edges)
+        self._update(edges, (n for v, u, _ in edges for n in (v, u)))
+
+    def _update(self, edges: list, nodes):
+        """
+        Registers new nodes and edges as new pairs and propagates them through the closure
+        """
+        first_new = len(self.nodes)
+        for n in nodes:
+            if n not in self.nodes_index:
+                self.nodes_index[n] = len(self.nodes)
+                self.nodes.append(n)
+        size = len(self.nodes)
+
+        if size != first_new:
+            for m in self.matrices.values():
+                m.resize((size, size))
+
+        rows = defaultdict(list)
+        cols = defaultdict(list)
+        new_nodes = np.arange(first_new, size)
+        for n in self.nullable:
+            rows[n].append(new_nodes)
+            cols[n].append(new_nodes)
+        by_label = defaultdict(lambda: ([], []))
+        for v, u, label in edges:
+            if label in self.by_terminal:
+                by_label[label][0].append(self.nodes_index[v])
+                by_label[label][1].append(self.nodes_index[u])
+        for label, (r, c) in by_label.items():
+            for n in self.by_terminal[label]:
+                rows[n].append(np.array(r, dtype=np.int64))
+                cols[n].append(np.array(c, dtype=np.int64))
+
+        delta = dict()
+        for n in rows.keys():
+            m = csr_matrix(
+                (
+                    np.ones(sum(map(len, rows[n])), dtype=bool),
+                    (np.concatenate(rows[n]), np.concatenate(cols[n])),
+                ),
+                shape=(size, size),
+                dtype=bool,
+            )
+            d = m > self.matrices[n]
+            if d.nnz != 0:
+                delta[n] = d
+                self.matrices[n] = self.matrices[n] + d
+
+        self.matrices, _ = propagate_deltas(
+            self.matrices, delta, self.productions, SparseBackend
+        )
+
+    def reachable(self, start, final, nonterminal=None) -> bool:
+        """
+        Checks whether final node is reachable from the start node by a path derived from the nonterminal
+        """
+        if nonterminal is None:
+            nonterminal = self.start_symbol
+        if start not in self.nodes_index or final not in self.nodes_index:
+            return False
+        return bool(
+            self.matrices[nonterminal][self.nodes_index[start], self.nodes_index[final]]
+        )
+
+    def query(self, start: set = None, final: set = None, nonterminal=None) -> set:
+        """
+        Solves reachability problem for provided start, final nodes and nonterminal symbol
+        """
+        if nonterminal is None:
+            nonterminal = self.start_symbol
+
+        result = set()
+        for v, u in zip(*self.matrices[nonterminal].nonzero()):
+            v, u = self.nodes[v], self.nodes[u]
+            if (start is None or v in start) and (final is None or u in final):
+                result.add((v, u))
+
+        return result
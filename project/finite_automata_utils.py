@@ -1,29 +1,87 @@
-from collections import defaultdict
+import os
+import pickle
+import tempfile
+from collections import OrderedDict, defaultdict
+from collections.abc import Mapping, Sequence
+from itertools import islice
 
 import networkx as nx
+import numpy as np
 from pyformlang.finite_automaton import *
 from pyformlang.regular_expression import *
 from scipy.sparse import *
 
+from project.bool_matrix import get_backend
+
+
+class RegexCache:
+    """
+    Represents LRU cache of minimal DFAs built from regexps together with their boolean decompositions
+    """
+
+    DIALECTS = {"regex": Regex, "python": PythonRegex}
+
+    def __init__(self, maxsize: int = 256):
+        """
+        :param maxsize: Maximal number of regexps kept in the cache
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._automata = OrderedDict()
+
+    def get(self, regexp: str, dialect: str = "regex") -> tuple:
+        """
+        Returns minimal DFA equivalent to the regexp and its boolean decomposition, building them only if they are not cached.
+        Returned objects are shared between the callers and must not be modified
+        :param regexp: regexp string
+        :param dialect: "regex" for basic regexps or "python" for python regexps
+        :return: Pair [DFA - BoolDecomposition]
+        """
+        key = (dialect, regexp)
+
+        if key in self._automata:
+            self.hits += 1
+            self._automata.move_to_end(key)
+            return self._automata[key]
+
+        self.misses += 1
+        if dialect not in RegexCache.DIALECTS:
+            raise Exception(f'Unknown regexp dialect "{dialect}"')
+        dfa = RegexCache.DIALECTS[dialect](regexp).to_epsilon_nfa().minimize()
+        result = (dfa, BoolDecomposition.from_fa(dfa))
+
+        self._automata[key] = result
+        if len(self._automata) > self.maxsize:
+            self._automata.popitem(last=False)
+        return result
+
+    def clear(self):
+        """
+        Removes all regexps from the cache
+        """
+        self._automata.clear()
+
+
+regex_cache = RegexCache()
+
 
 def build_DFA_from_regexp(regexp: str) -> DeterministicFiniteAutomaton:
     """
-    Builds DFA from regexp string
+    Builds DFA from regexp string. DFA is copied from regex_cache, so the caller may modify it
     :param regexp: basic regexp string
     :return: DFA equivalent to the regexp
     """
-    regexp = Regex(regexp)
-    return regexp.to_epsilon_nfa().minimize()
+    return regex_cache.get(regexp, "regex")[0].copy()
 
 
 def build_DFA_from_python_regexp(regexp: str) -> DeterministicFiniteAutomaton:
     """
-    Builds DFA from python regexp string
+    Builds DFA from python regexp string. DFA is copied from regex_cache, so the caller may modify it
     :param regexp: python regexp string
     :return: DFA equivalent to the regexp
     """
-    regexp = PythonRegex(regexp)
-    return regexp.to_epsilon_nfa().minimize()
+    return regex_cache.get(regexp, "python")[0].copy()
 
 
 def build_NDFA_from_graph(
@@ -57,58 +115,618 @@ def build_NDFA_from_graph(
     return ndfa
 
 
-def convert_FA_to_matrix_form(fa: EpsilonNFA) -> dict[any, dok_matrix]:
+class BoolDecomposition:
+    """
+    Represents boolean decomposition of a finite automaton
+    """
+
+    __slots__ = ("states", "_indices", "matrices", "start", "final")
+
+    def __init__(
+        self,
+        states: list,
+        matrices: dict,
+        start: np.ndarray,
+        final: np.ndarray,
+        indices: dict = None,
+    ):
+        """
+        :param states: States of the automaton, position of a state is its index in the matrices
+        :param matrices: Dict of pairs [symbol - adjacency matrix]
+        :param start: Indices of the start states
+        :param final: Indices of the final states
+        :param indices: Dict of pairs [state - index]. If None - built from the states
+        """
+        self.states = states
+        self._indices = indices
+        self.matrices = matrices
+        self.start = start
+        self.final = final
+
+    @property
+    def indices(self) -> dict:
+        """
+        Dict of pairs [state - index], built from the states on the first access
+        """
+        if self._indices is None:
+            self._indices = {s: i for i, s in enumerate(self.states)}
+        return self._indices
+
+    @staticmethod
+    def from_fa(fa: EpsilonNFA):
+        """
+        Creates a boolean decomposition of the NDFA
+        :param fa: NDFA to be decomposed
+        :return: Boolean decomposition of the NDFA
+        """
+        states = list(fa.states)
+        indices = {s: i for i, s in enumerate(states)}
+
+        rows = defaultdict(list)
+        cols = defaultdict(list)
+        for s, symb, f in fa:
+            rows[symb].append(indices[s])
+            cols[symb].append(indices[f])
+
+        matrices = {
+            symb: csr_matrix(
+                (np.ones(len(rows[symb]), dtype=bool), (rows[symb], cols[symb])),
+                shape=(len(states), len(states)),
+                dtype=bool,
+            )
+            for symb in rows.keys()
+        }
+
+        return BoolDecomposition(
+            states,
+            matrices,
+            np.array([indices[s] for s in fa.start_states], dtype=np.int64),
+            np.array([indices[s] for s in fa.final_states], dtype=np.int64),
+        )
+
+    @staticmethod
+    def from_graph(graph: nx.DiGraph, start: set = None, final: set = None):
+        """
+        Creates a boolean decomposition of the graph as an NDFA without building the NDFA
+        :param graph: Graph with labeled edges
+        :param start: Start nodes. If None - all nodes are considered start nodes
+        :param final: Final nodes. If None - all nodes are considered final nodes
+        :return: Boolean decomposition with graph nodes as states and edge labels as symbols
+        """
+        states = list(graph.nodes)
+        indices = {v: i for i, v in enumerate(states)}
+
+        rows = defaultdict(list)
+        cols = defaultdict(list)
+        for v, u, label in graph.edges(data="label"):
+            rows[label].append(indices[v])
+            cols[label].append(indices[u])
+
+        matrices = {
+            label: csr_matrix(
+                (
+                    np.ones(len(rows[label]), dtype=bool),
+                    (
+                        np.array(rows[label], dtype=np.int64),
+                        np.array(cols[label], dtype=np.int64),
+                    ),
+                ),
+                shape=(len(states), len(states)),
+                dtype=bool,
+            )
+            for label in rows.keys()
+        }
+
+        all_nodes = np.arange(len(states), dtype=np.int64)
+        return BoolDecomposition(
+            states, matrices, all_nodes, all_nodes, indices
+        ).with_start_final(start, final)
+
+    @property
+    def size(self) -> int:
+        """
+        Number of states
+        """
+        return len(self.states)
+
+    def state(self, index: int):
+        """
+        Returns state by its index
+        """
+        return self.states[index]
+
+    def with_start_final(self, start=None, final=None):
+        """
+        Returns decomposition sharing matrices with the current one but with other start and final states
+        :param start: Start states. If None - start states are kept
+        :param final: Final states. If None - final states are kept
+        :return: Boolean decomposition with the given start and final states
+        """
+
+        def to_indices(states, current: np.ndarray) -> np.ndarray:
+            if states is None:
+                return current
+            return np.array(
+                [self.indices[s] for s in states if s in self.indices], dtype=np.int64
+            )
+
+        return BoolDecomposition(
+            self.states,
+            self.matrices,
+            to_indices(start, self.start),
+            to_indices(final, self.final),
+            self._indices,
+        )
+
+    def successors(self, front: csr_matrix) -> csr_matrix:
+        """
+        Makes one step from every state of the front by any symbol
+        :param front: Matrix [row - state] of the current states
+        :return: Matrix [row - state] of the states reachable in one step
+        """
+        result = csr_matrix(front.shape, dtype=bool)
+        for m in self.matrices.values():
+            result = result + front @ m
+        return result
+
+    def to_fa(self) -> EpsilonNFA:
+        """
+        Builds NDFA from the decomposition
+        :return: NDFA with the states of the decomposition
+        """
+        result = EpsilonNFA()
+
+        for symb, m in self.matrices.items():
+            for s, f in zip(*m.nonzero()):
+                result.add_transition(self.states[s], symb, self.states[f])
+
+        for s in self.start:
+            result.add_start_state(self.states[s])
+
+        for f in self.final:
+            result.add_final_state(self.states[f])
+
+        return result
+
+
+DECOMPOSITION_MAGIC = b"BOOLDEC1"
+
+
+class MappedMatrices(Mapping):
+    """
+    Represents dict of pairs [symbol - adjacency matrix] stored in the decomposition file.
+    Matrix of a symbol is mapped into memory only when it is requested
+    """
+
+    def __init__(
+        self, path: str, offset: int, size: int, dtype: np.dtype, symbols: dict
+    ):
+        """
+        :param path: Path to the decomposition file
+        :param offset: Position of the index arrays in the file
+        :param size: Number of states
+        :param dtype: Type of the stored index arrays
+        :param symbols: Dict of pairs [symbol - [indptr offset - indices offset - number of edges]],
+        offsets are counted from the position of the index arrays
+        """
+        self.path = path
+        self.offset = offset
+        self.size = size
+        self.dtype = dtype
+        self.symbols = symbols
+        self._matrices = dict()
+
+    def __getitem__(self, symbol) -> csr_matrix:
+        if symbol not in self._matrices:
+            indptr_offset, indices_offset, nnz = self.symbols[symbol]
+            indptr = np.memmap(
+                self.path,
+                dtype=self.dtype,
+                mode="r",
+                offset=self.offset + indptr_offset,
+                shape=(self.size + 1,),
+            )
+            indices = (
+                np.memmap(
+                    self.path,
+                    dtype=self.dtype,
+                    mode="r",
+                    offset=self.offset + indices_offset,
+                    shape=(nnz,),
+                )
+                if nnz != 0
+                else np.zeros(0, dtype=self.dtype)
+            )
+            self._matrices[symbol] = csr_matrix(
+                (np.ones(nnz, dtype=bool), indices, indptr),
+                shape=(self.size, self.size),
+                dtype=bool,
+            )
+        return self._matrices[symbol]
+
+    def __iter__(self):
+        return iter(self.symbols)
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+
+def _decomposition_data_offset(header_size: int, symbols_size: int) -> int:
+    """
+    Position of the index arrays in the decomposition file, aligned to 8 bytes
+    """
+    return -(-(len(DECOMPOSITION_MAGIC) + 16 + header_size + symbols_size) // 8) * 8
+
+
+def save_bool_decomposition(decomposition: BoolDecomposition, path: str):
+    """
+    Saves boolean decomposition to a file that can be loaded with load_bool_decomposition.
+    The file holds the header with states followed by CSR index arrays of every symbol
+    :param decomposition: Boolean decomposition to be saved
+    :param path: Path to the file
+    """
+    size = decomposition.size
+    matrices = {
+        symb: csr_matrix(m, dtype=bool) for symb, m in decomposition.matrices.items()
+    }
+    max_index = max([size] + [m.nnz for m in matrices.values()])
+    dtype = np.dtype(np.int32 if max_index < np.iinfo(np.int32).max else np.int64)
+
+    def aligned(offset: int) -> int:
+        return -(-offset // 8) * 8
+
+    layout = dict()
+    offset = 0
+    for symb, m in matrices.items():
+        m.sort_indices()
+        indices_offset = aligned(offset + (size + 1) * dtype.itemsize)
+        layout[symb] = (offset, indices_offset, m.nnz)
+        offset = aligned(indices_offset + m.nnz * dtype.itemsize)
+
+    header = pickle.dumps(
+        {
+            "states": decomposition.states,
+            "start": decomposition.start,
+            "final": decomposition.final,
+            "dtype": dtype.str,
+        }
+    )
+    symbols = pickle.dumps(layout)
+    data_offset = _decomposition_data_offset(len(header), len(symbols))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile("wb", dir=directory, delete=False) as f:
+        f.write(DECOMPOSITION_MAGIC)
+        f.write(np.array([len(header), len(symbols)], dtype="<u8").tobytes())
+        f.write(header)
+        f.write(symbols)
+        for symb, m in matrices.items():
+            indptr_offset, indices_offset, _ = layout[symb]
+            f.seek(data_offset + indptr_offset)
+            f.write(m.indptr.astype(dtype).tobytes())
+            f.seek(data_offset + indices_offset)
+            f.write(m.indices.astype(dtype).tobytes())
+        f.truncate(data_offset + offset)
+    os.replace(f.name, path)
+
+
+def load_bool_decomposition(path: str) -> BoolDecomposition:
+    """
+    Loads boolean decomposition saved with save_bool_decomposition.
+    Only the states are read, matrices are mapped into memory when a symbol is first used
+    :param path: Path to the file
+    :return: Boolean decomposition with the stored states and lazily mapped matrices
+    """
+    with open(path, "rb") as f:
+        if f.read(len(DECOMPOSITION_MAGIC)) != DECOMPOSITION_MAGIC:
+            raise Exception(f'"{path}" is not a boolean decomposition file')
+        header_size, symbols_size = np.frombuffer(f.read(16), dtype="<u8")
+        header = pickle.loads(f.read(int(header_size)))
+        symbols = pickle.loads(f.read(int(symbols_size)))
+
+    states = header["states"]
+    matrices = MappedMatrices(
+        path,
+        _decomposition_data_offset(int(header_size), int(symbols_size)),
+        len(states),
+        np.dtype(header["dtype"]),
+        symbols,
+    )
+    return BoolDecomposition(states, matrices, header["start"], header["final"])
+
+
+class GraphIndex:
+    """
+    Represents boolean decomposition of a graph that is built once and shared between queries.
+    The decomposition is rebuilt after invalidate() or when the number of nodes or edges of the graph changes
+    """
+
+    def __init__(self, graph: nx.DiGraph):
+        """
+        :param graph: Indexed graph
+        """
+        self.graph = graph
+        self.version = 0
+        self._built_for = None
+        self._decomposition = None
+
+    def invalidate(self):
+        """
+        Marks the decomposition as outdated, must be called after changes not visible in the fingerprint
+        """
+        self.version += 1
+
+    def fingerprint(self) -> tuple:
+        """
+        Returns triple [version - number of nodes - number of edges] identifying the graph state
+        """
+        return (
+            self.version,
+            self.graph.number_of_nodes(),
+            self.graph.number_of_edges(),
+        )
+
+    @property
+    def decomposition(self) -> BoolDecomposition:
+        """
+        Boolean decomposition of the graph with all the nodes as start and final states
+        """
+        fingerprint = self.fingerprint()
+        if self._decomposition is None or self._built_for != fingerprint:
+            self._decomposition = BoolDecomposition.from_graph(self.graph)
+            self._built_for = fingerprint
+        return self._decomposition
+
+    @property
+    def nodes_index(self) -> dict:
+        """
+        Dict of pairs [node - index in the decomposition matrices]
+        """
+        return self.decomposition.indices
+
+
+def _graph_decomposition(graph, start=None, final=None) -> BoolDecomposition:
+    """
+    Returns boolean decomposition of the graph
+    :param graph: Graph, GraphIndex or boolean decomposition of the graph
+    :param start: Start nodes. If None - all nodes are considered start nodes
+    :param final: Final nodes. If None - all nodes are considered final nodes
+    :return: Boolean decomposition of the graph as an NDFA
+    """
+    if isinstance(graph, GraphIndex):
+        return graph.decomposition.with_start_final(start, final)
+    if isinstance(graph, BoolDecomposition):
+        return graph.with_start_final(start, final)
+    return BoolDecomposition.from_graph(graph, start, final)
+
+
+class LazyProductDecomposition:
+    """
+    Represents boolean decomposition of the product of two automata without materialized Kronecker products
+    """
+
+    __slots__ = ("left", "right", "symbols", "transposed", "start", "final")
+
+    def __init__(self, left: BoolDecomposition, right: BoolDecomposition):
+        """
+        :param left: Decomposition of the first automaton, product index of [i, j] is i * right.size + j
+        :param right: Decomposition of the second automaton
+        """
+        self.left = left
+        self.right = right
+        self.symbols = list(left.matrices.keys() & right.matrices.keys())
+        self.transposed = {
+            symb: left.matrices[symb].transpose().tocsr() for symb in self.symbols
+        }
+        self.start = self._product(left.start, right.start)
+        self.final = self._product(left.final, right.final)
+
+    def _product(self, i1: np.ndarray, i2: np.ndarray) -> np.ndarray:
+        return (i1[:, None] * self.right.size + i2[None, :]).ravel()
+
+    @property
+    def size(self) -> int:
+        """
+        Number of states
+        """
+        return self.left.size * self.right.size
+
+    def state(self, index: int) -> tuple:
+        """
+        Returns pair of the original states by the product state index
+        """
+        return (
+            self.left.states[index // self.right.size],
+            self.right.states[index % self.right.size],
+        )
+
+    def successors(self, front: csr_matrix) -> csr_matrix:
+        """
+        Makes one step from every state of the front by any symbol.
+        Every row of the front is reshaped to a [left state - right state] matrix X, the step is A^T @ X @ B
+        :param front: Matrix [row - product state] of the current states
+        :return: Matrix [row - product state] of the states reachable in one step
+        """
+        n1, n2 = self.left.size, self.right.size
+
+        front = front.tocoo()
+        # Only the occupied [front row - left state] pairs are stacked, so the size does not depend on rows * n1
+        pairs, stacked_rows = np.unique(
+            front.row.astype(np.int64) * n1 + front.col // n2, return_inverse=True
+        )
+        stacked = csr_matrix(
+            (np.ones(len(stacked_rows), dtype=bool), (stacked_rows, front.col % n2)),
+            shape=(len(pairs), n2),
+            dtype=bool,
+        )
+
+        result = csr_matrix(front.shape, dtype=bool)
+        for symb in self.symbols:
+            # rows of all the front matrices stacked vertically, multiplied by B
+            step = (stacked @ self.right.matrices[symb]).tocoo()
+            sr, si1 = pairs[step.row] // n1, pairs[step.row] % n1
+
+            # front matrices placed side by side over the occupied [front row - right state] pairs,
+            # multiplied by A^T
+            columns, joined_cols = np.unique(sr * n2 + step.col, return_inverse=True)
+            joined = csr_matrix(
+                (np.ones(len(joined_cols), dtype=bool), (si1, joined_cols)),
+                shape=(n1, len(columns)),
+                dtype=bool,
+            )
+            joined = (self.transposed[symb] @ joined).tocoo()
+            jr, j1, j2 = (
+                columns[joined.col] // n2,
+                joined.row,
+                columns[joined.col] % n2,
+            )
+
+            result = result + csr_matrix(
+                (np.ones(len(jr), dtype=bool), (jr, j1 * n2 + j2)),
+                shape=front.shape,
+                dtype=bool,
+            )
+
+        return result
+
+
+class ProductStates(Sequence):
+    """
+    Represents states of the product automaton, the pair of the original states is made when it is accessed
+    """
+
+    __slots__ = ("left", "right")
+
+    def __init__(self, left: Sequence, right: Sequence):
+        """
+        :param left: States of the first automaton, product index of [i, j] is i * len(right) + j
+        :param right: States of the second automaton
+        """
+        self.left = left
+        self.right = right
+
+    def __getitem__(self, index: int) -> tuple:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.left[index // len(self.right)], self.right[index % len(self.right)]
+
+    def __len__(self) -> int:
+        return len(self.left) * len(self.right)
+
+
+def convert_FA_to_matrix_form(fa: EpsilonNFA) -> dict[any, csr_matrix]:
     """
     Creates a boolean decomposition of the NDFA
     :param fa: NDFA to be decomposed
     :return: Dict of pairs [symbol - adjacency matrix] representing the original NDFA
     """
-    result = dict()
+    return BoolDecomposition.from_fa(fa).matrices
+
 
-    states = list(fa.states)
-    matrix_size = len(states)
+def intersect_bool_decompositions(
+    d1: BoolDecomposition, d2: BoolDecomposition, backend="sparse"
+) -> BoolDecomposition:
+    """
+    Intersects two boolean decompositions
+    :param d1: first boolean decomposition
+    :param d2: second boolean decomposition
+    :param backend: Boolean matrix backend name ("sparse", "bitpacked" or "auto") or class
+    :return: Boolean decomposition of the product automaton, its states are pairs of the original states
+    """
+    symbols = d1.matrices.keys() & d2.matrices.keys()
+    backend = get_backend(
+        backend,
+        max(
+            (
+                d1.matrices[symb].nnz * d2.matrices[symb].nnz / (d1.size * d2.size) ** 2
+                for symb in symbols
+            ),
+            default=0.0,
+        ),
+    )
 
-    for s, symb, f in fa:
-        matrix = result.setdefault(
-            symb, dok_matrix((matrix_size, matrix_size), dtype=bool)
+    matrices = {
+        symb: backend.to_sparse(
+            backend.kron(
+                backend.from_sparse(d1.matrices[symb]),
+                backend.from_sparse(d2.matrices[symb]),
+            )
         )
-        matrix[states.index(s), states.index(f)] = True
+        for symb in symbols
+    }
 
-    return result
+    def product(i1: np.ndarray, i2: np.ndarray) -> np.ndarray:
+        return (i1[:, None] * d2.size + i2[None, :]).ravel()
+
+    return BoolDecomposition(
+        ProductStates(d1.states, d2.states),
+        matrices,
+        product(d1.start, d2.start),
+        product(d1.final, d2.final),
+    )
 
 
-def intersect_FA(fa1: EpsilonNFA, fa2: EpsilonNFA) -> EpsilonNFA:
+def _reachable_part(d: BoolDecomposition) -> BoolDecomposition:
     """
-    Intersects two NDFAs
-    :param fa1: first NDFA
-    :param fa2: second NDFA
-    :return: NDFA that accepts only words accepted by both original NDFAs
+    Removes states unreachable from the start states, the states are looked up only for the reached indices
+    :param d: Boolean decomposition of the automaton
+    :return: Boolean decomposition of the automaton with the reachable states only
     """
-    m1 = convert_FA_to_matrix_form(fa1)
-    m2 = convert_FA_to_matrix_form(fa2)
-    states1 = list(fa1.states)
-    states2 = list(fa2.states)
+    front = csr_matrix(
+        (np.ones(len(d.start), dtype=bool), (np.zeros(len(d.start)), d.start)),
+        shape=(1, d.size),
+        dtype=bool,
+    )
+    visited = front
+    while front.nnz != 0:
+        front = d.successors(front) > visited
+        visited = visited + front
 
-    result = EpsilonNFA()
+    reached = np.sort(visited.indices)
+    return BoolDecomposition(
+        [d.states[i] for i in reached],
+        {symb: m[reached][:, reached] for symb, m in d.matrices.items()},
+        np.searchsorted(reached, d.start),
+        np.searchsorted(reached, d.final[np.isin(d.final, reached)]),
+    )
 
-    for symb in m1.keys() & m2.keys():
-        mi = kron(m1[symb], m2[symb])
-        for s, f in zip(*mi.nonzero()):
-            result.add_transition(s, symb, f)
 
-    for state1 in fa1.start_states:
-        for state2 in fa2.start_states:
-            result.add_start_state(
-                states1.index(state1) * len(states2) + states2.index(state2)
-            )
+def _without_epsilons(fa: EpsilonNFA) -> EpsilonNFA:
+    """
+    Returns NDFA without epsilon transitions and with the same states if fa has epsilon transitions, otherwise fa
+    """
+    if any(isinstance(symb, Epsilon) for _, symb, _ in fa):
+        return fa.remove_epsilon_transitions()
+    return fa
 
-    for state1 in fa1.final_states:
-        for state2 in fa2.final_states:
-            result.add_final_state(
-                states1.index(state1) * len(states2) + states2.index(state2)
-            )
 
-    return result
+def intersect_FA(
+    fa1: EpsilonNFA, fa2: EpsilonNFA, backend="sparse", lazy: bool = False
+) -> EpsilonNFA | LazyProductDecomposition:
+    """
+    Intersects two NDFAs
+    :param fa1: first NDFA
+    :param fa2: second NDFA
+    :param backend: Boolean matrix backend name ("sparse", "bitpacked" or "auto") or class
+    :param lazy: If True - returns LazyProductDecomposition of the intersection instead of NDFA
+    :return: NDFA that accepts only words accepted by both original NDFAs, its states are pairs
+    [state of the first NDFA - state of the second NDFA]
+    """
+    d1 = BoolDecomposition.from_fa(_without_epsilons(fa1))
+    d2 = BoolDecomposition.from_fa(_without_epsilons(fa2))
+    if lazy:
+        return LazyProductDecomposition(d1, d2)
+
+    di = _reachable_part(intersect_bool_decompositions(d1, d2, backend))
+
+    return BoolDecomposition(
+        [State((s1.value, s2.value)) for s1, s2 in di.states],
+        di.matrices,
+        di.start,
+        di.final,
+    ).to_fa()
 
 
 def _find_common_paths_in_FAs(
@@ -120,21 +738,48 @@ def _find_common_paths_in_FAs(
     :param fa2: second NDFA
     :return: List of pairs [start state - final state] from first NDFA that satisfy both NDFAs
     """
-    fai = intersect_FA(fa1, fa2)
-    graph = nx.transitive_closure(nx.DiGraph(fai.to_networkx()))
-    states = list(fa1.states)
-    result = []
+    return _find_common_paths(
+        BoolDecomposition.from_fa(fa1), BoolDecomposition.from_fa(fa2)
+    )
 
-    for s in fai.start_states:
-        for f in fai.final_states:
-            if nx.has_path(graph, s, f):
-                result.append(
-                    (
-                        states[s.value // len(fa2.states)],
-                        states[f.value // len(fa2.states)],
-                    )
-                )
-    return result
+
+def _find_common_paths(
+    d1: BoolDecomposition, d2: BoolDecomposition
+) -> list[tuple[State, State]]:
+    """
+    Returns list of pairs [start state - final state] from first automaton that satisfy both automata
+    :param d1: boolean decomposition of the first automaton
+    :param d2: boolean decomposition of the second automaton
+    :return: List of pairs [start state - final state] from first automaton that satisfy both automata
+    """
+    di = LazyProductDecomposition(d1, d2)
+    visited = _multiple_source_reachability(di)
+
+    result = dict()
+    for i, j in zip(*visited[:, di.final].nonzero()):
+        s = di.state(di.start[i])[0]
+        f = di.state(di.final[j])[0]
+        result[(s, f)] = None
+    return list(result)
+
+
+def _multiple_source_reachability(d) -> csr_matrix:
+    """
+    Runs BFS over all the symbols from every start state at once
+    :param d: BoolDecomposition or LazyProductDecomposition of the automaton
+    :return: Matrix [start state - state] with True for every state reachable from the start state
+    """
+    front = csr_matrix(
+        (np.ones(len(d.start), dtype=bool), (np.arange(len(d.start)), d.start)),
+        shape=(len(d.start), d.size),
+        dtype=bool,
+    )
+    visited = front
+    while front.nnz != 0:
+        front = d.successors(front) > visited
+        visited = visited + front
+
+    return visited
 
 
 def query_graph_with_regexp(
@@ -142,15 +787,14 @@ def query_graph_with_regexp(
 ) -> list[tuple]:
     """
     Returns list of pairs [start vertex - final vertex] from graph that satisfy graph as an ANDA and regexp simultaneously
-    :param graph: Graph representation of the NDFA
+    :param graph: Graph representation of the NDFA, GraphIndex built for it or its boolean decomposition
     :param start: Start states of the NDFA. If None - all states are considered start states
     :param final: Final states of the resulting NDFA. If None - all states are considered final states
     :param regexp: basic regexp string
     :return: List of pairs [start vertex - final vertex] from graph that satisfy graph as an ANDA and regexp simultaneously
     """
-    fa1 = build_NDFA_from_graph(graph, start, final)
-    fa2 = build_DFA_from_regexp(regexp)
-    return _find_common_paths_in_FAs(fa1, fa2)
+    d1 = _graph_decomposition(graph, start, final)
+    return _find_common_paths(d1, regex_cache.get(regexp, "regex")[1])
 
 
 def query_graph_with_python_regexp(
@@ -158,146 +802,421 @@ def query_graph_with_python_regexp(
 ) -> list[tuple]:
     """
     Returns list of pairs [start vertex - final vertex] from graph that satisfy graph as an ANDA and python regexp simultaneously
-    :param graph: Graph representation of the NDFA
+    :param graph: Graph representation of the NDFA, GraphIndex built for it or its boolean decomposition
     :param start: Start states of the NDFA. If None - all states are considered start states
     :param final: Final states of the resulting NDFA. If None - all states are considered final states
     :param regexp: python regexp string
     :return: List of pairs [start vertex - final vertex] from graph that satisfy graph as an ANDA and python regexp simultaneously
     """
-    fa1 = build_NDFA_from_graph(graph, start, final)
-    fa2 = build_DFA_from_python_regexp(regexp)
-    return _find_common_paths_in_FAs(fa1, fa2)
+    d1 = _graph_decomposition(graph, start, final)
+    return _find_common_paths(d1, regex_cache.get(regexp, "python")[1])
+
+
+def _constrained_bfs_levels(
+    constraint: BoolDecomposition,
+    graph_d: BoolDecomposition,
+    groups: list,
+    backend="sparse",
+):
+    """
+    Runs BFS over the graph with the automaton constraint from every group of start nodes at once.
+    The next level is computed only when the previous one is consumed
+    :param constraint: Boolean decomposition of the constraint automaton
+    :param graph_d: Boolean decomposition of the graph
+    :param groups: List of sets of start nodes
+    :param backend: Boolean matrix backend name ("sparse", "bitpacked" or "auto") or class
+    :return: Generator of matrices [group index * constraint size + constraint state - graph node]
+    of the pairs first visited on each level
+    """
+    constraint_m = constraint.matrices
+    graph_m = graph_d.matrices
+
+    symbols = constraint_m.keys() & graph_m.keys()
+    k = constraint.size
+    # The packed operand is the block diagonal matrix of size (groups * k)^2 with nnz(C_s) * groups cells
+    backend = get_backend(
+        backend,
+        max(
+            (
+                constraint_m[symb].nnz / (max(len(groups), 1) * k**2)
+                for symb in symbols
+            ),
+            default=0.0,
+        ),
+    )
+
+    # The front stacks one [constraint state - graph node] block per group of start nodes,
+    # a step over symbol s maps every block X to C_s^T @ X @ G_s with a single block diagonal C
+    blocks = eye(len(groups), dtype=bool, format="csr")
+    steps = [
+        (
+            backend.from_sparse(
+                kron(blocks, constraint_m[symb].transpose(), format="csr")
+            ),
+            backend.from_sparse(graph_m[symb]),
+        )
+        for symb in symbols
+    ]
+    shape = (len(groups) * k, graph_d.size)
+
+    rows, cols = [], []
+    for g, group in enumerate(groups):
+        group_cols = [graph_d.indices[n] for n in group if n in graph_d.indices]
+        rows.append(np.repeat(g * k + constraint.start, len(group_cols)))
+        cols.append(
+            np.tile(np.array(group_cols, dtype=np.int64), len(constraint.start))
+        )
+    rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+    cols = np.concatenate(cols) if cols else np.zeros(0, dtype=np.int64)
+
+    front = backend.from_sparse(
+        csr_matrix((np.ones(len(rows), dtype=bool), (rows, cols)), shape=shape)
+    )
+    visited = front
+
+    while backend.nnz(front) != 0:
+        yield backend.to_sparse(front).tocoo()
+        new = backend.zeros(shape)
+        for c, g in steps:
+            new = backend.add(new, backend.multiply(backend.multiply(c, front), g))
+        front = backend.difference(new, visited)
+        visited = backend.add(visited, front)
+
+
+def _constrained_bfs(
+    constraint: BoolDecomposition,
+    graph_d: BoolDecomposition,
+    groups: list,
+    backend="sparse",
+) -> coo_matrix:
+    """
+    Runs BFS over the graph with the automaton constraint from every group of start nodes at once
+    :param constraint: Boolean decomposition of the constraint automaton
+    :param graph_d: Boolean decomposition of the graph
+    :param groups: List of sets of start nodes
+    :param backend: Boolean matrix backend name ("sparse", "bitpacked" or "auto") or class
+    :return: Matrix [group index * constraint size + constraint state - graph node] of the visited pairs
+    """
+    levels = list(_constrained_bfs_levels(constraint, graph_d, groups, backend))
+    rows = np.concatenate([level.row for level in levels] + [np.zeros(0, np.int64)])
+    cols = np.concatenate([level.col for level in levels] + [np.zeros(0, np.int64)])
+    return coo_matrix(
+        (np.ones(len(rows), dtype=bool), (rows, cols)),
+        shape=(len(groups) * constraint.size, graph_d.size),
+    )
 
 
 def nodes_accesible_with_regexp_constraint(
-    nodes: set, graph: nx.MultiDiGraph, repexp: str, separate_for_nodes=False
+    nodes: set,
+    graph: nx.MultiDiGraph,
+    repexp: str,
+    separate_for_nodes=False,
+    backend="sparse",
 ) -> dict[any, set]:
     """
     Computes nodes that can be achieved in graph from the start nodes with regexp constraint
     :param nodes: Starting nodes in BFS
-    :param graph: Graph representation of the NDFA
+    :param graph: Graph representation of the NDFA, GraphIndex built for it or its boolean decomposition
     :param repexp: Basic regexp string
     :param separate_for_nodes: If True - computes separate result for each node in nodes. If False - computes one result with all nodes in Node marked as starting
-    :return: Dict with either one entry [set of nodes - set of all the achievable nodes] or separate entries for each node in nodes depending on the separate_for_nodes param
-    """
-    regexp_dfa = build_DFA_from_regexp(repexp)
-    constraint_m = convert_FA_to_matrix_form(regexp_dfa)
-    constraint_nodes = list(regexp_dfa.states)
-    graph_ndfa = build_NDFA_from_graph(graph)
-    graph_m = convert_FA_to_matrix_form(graph_ndfa)
-    graph_nodes = list(graph_ndfa.states)
+    :param backend: Boolean matrix backend name ("sparse", "bitpacked" or "auto") or class
+    :return: Dict with either one entry [frozenset of nodes - set of all the achievable nodes] or separate entries for each node in nodes depending on the separate_for_nodes param
+    """
+    _, constraint = regex_cache.get(repexp, "regex")
+    graph_d = _graph_decomposition(graph)
+
+    nodes = list(nodes)
+    if separate_for_nodes:
+        groups, keys = [{n} for n in nodes], nodes
+    else:
+        groups, keys = [set(nodes)], [frozenset(nodes)]
+    k = constraint.size
+
+    visited = _constrained_bfs(constraint, graph_d, groups, backend)
+    is_final = np.zeros(k, dtype=bool)
+    is_final[constraint.final] = True
+    reached = is_final[visited.row % k]
+
+    result = {key: set() for key in keys}
+    for g, col in zip(visited.row[reached] // k, visited.col[reached]):
+        result[keys[g]].add(graph_d.states[col])
+
+    return result
+
+
+def iter_query_graph_with_regexp(
+    graph, start: set, final: set, regexp: str, backend="sparse"
+):
+    """
+    Runs a BFS and yields pairs [start vertex - final vertex] from graph that have the corresponding path with regexp constraint
+    as soon as they are discovered. The BFS stops when the generator is no longer consumed
+    :param graph: Graph representation of the NDFA, GraphIndex built for it or its boolean decomposition
+    :param start: Start states of the NDFA. If None - all states are considered start states
+    :param final: Final states of the NDFA. If None - all states are considered final states
+    :param regexp: basic regexp string
+    :param backend: Boolean matrix backend name ("sparse", "bitpacked" or "auto") or class
+    :return: Generator of pairs [start vertex - final vertex] without repetitions
+    """
+    _, constraint = regex_cache.get(regexp, "regex")
+    graph_d = _graph_decomposition(graph)
+    start = list(graph_d.states if start is None else set(start))
+    final = None if final is None else set(final)
+    k = constraint.size
+
+    is_final = np.zeros(k, dtype=bool)
+    is_final[constraint.final] = True
+
+    found = set()
+    for level in _constrained_bfs_levels(
+        constraint, graph_d, [{s} for s in start], backend
+    ):
+        reached = is_final[level.row % k]
+        for row, col in zip(level.row[reached], level.col[reached]):
+            pair = (start[row // k], graph_d.states[col])
+            if pair not in found and (final is None or pair[1] in final):
+                found.add(pair)
+                yield pair
+
+
+def bfs_query_graph_with_regexp(
+    graph, start: set, final: set, regexp: str, limit: int = None, backend="sparse"
+) -> list[tuple]:
+    """
+    Runs a BFS and returns pairs [start vertex - final vertex] from graph that have the corresponding path with regexp constraint
+    :param graph: Graph representation of the NDFA, GraphIndex built for it or its boolean decomposition
+    :param start: Start states of the NDFA. If None - all states are considered start states
+    :param final: Final states of the NDFA. If None - all states are considered final states
+    :param regexp: basic regexp string
+    :param limit: Maximal number of returned pairs, the BFS stops as soon as they are found. If None - all pairs are returned
+    :param backend: Boolean matrix backend name ("sparse", "bitpacked" or "auto") or class
+    :return: List of pairs [start vertex - final vertex] from graph that have the corresponding path with regexp constraint
+    """
+    return list(
+        islice(
+            iter_query_graph_with_regexp(graph, start, final, regexp, backend), limit
+        )
+    )
+
+
+def exists_path(graph, start, final, regexp: str, backend="sparse") -> bool:
+    """
+    Checks whether there is a path from the start vertex to the final vertex with regexp constraint.
+    The BFS stops as soon as the final vertex is reached
+    :param graph: Graph representation of the NDFA, GraphIndex built for it or its boolean decomposition
+    :param start: Start vertex
+    :param final: Final vertex
+    :param regexp: basic regexp string
+    :param backend: Boolean matrix backend name ("sparse", "bitpacked" or "auto") or class
+    :return: True if the path exists
+    """
+    pairs = iter_query_graph_with_regexp(graph, {start}, {final}, regexp, backend)
+    return next(pairs, None) is not None
+
+
+def intersect_graph_with_regexp(
+    graph,
+    start: set,
+    final: set,
+    regexp: str,
+    backend="sparse",
+    decomposition: bool = False,
+):
+    """
+    Builds the part of the intersection of graph and regexp automata reachable from the start vertices.
+    Reachable pairs are found with one BFS, so the unreachable part of the product is never built
+    :param graph: Graph representation of the NDFA, GraphIndex built for it or its boolean decomposition
+    :param start: Start vertices. If None - all vertices are considered start vertices
+    :param final: Final vertices. If None - all vertices are considered final vertices
+    :param regexp: basic regexp string
+    :param backend: Boolean matrix backend name ("sparse", "bitpacked" or "auto") or class
+    :param decomposition: If True - returns BoolDecomposition of the intersection instead of NDFA
+    :return: NDFA with states [graph vertex - regexp DFA state]
+    """
+    _, constraint = regex_cache.get(regexp, "regex")
+    graph_d = _graph_decomposition(graph, start, final)
+    sources = {graph_d.states[i] for i in graph_d.start}
+    visited = _constrained_bfs(constraint, graph_d, [sources], backend).tocsr()
+    visited.sum_duplicates()
+
+    # Product states are numbered in the order of the visited matrix cells
+    n = graph_d.size
+    qs, vs = visited.nonzero()
+    keys = qs.astype(np.int64) * n + vs
+
+    def index(q, v) -> np.ndarray:
+        return np.searchsorted(keys, np.asarray(q, dtype=np.int64) * n + v)
+
     matrices = dict()
+    for symb in constraint.matrices.keys() & graph_d.matrices.keys():
+        rows, cols = [], []
+        for q, q_next in zip(*constraint.matrices[symb].nonzero()):
+            first = visited.indptr[q]
+            step = graph_d.matrices[symb][
+                visited.indices[first : visited.indptr[q + 1]]
+            ]
+            r, v_next = step.nonzero()
+            rows.append(first + r)
+            cols.append(index(q_next, v_next))
+        if rows:
+            r, c = np.concatenate(rows), np.concatenate(cols)
+            matrices[symb] = csr_matrix(
+                (np.ones(len(r), dtype=bool), (r, c)),
+                shape=(len(keys), len(keys)),
+                dtype=bool,
+            )
 
-    for symb in constraint_m.keys() & graph_m.keys():
-        matrices[symb] = block_diag((constraint_m[symb], graph_m[symb]))
+    is_final = np.zeros((constraint.size, n), dtype=bool)
+    is_final[np.ix_(constraint.final, graph_d.final)] = True
+    product = BoolDecomposition(
+        [
+            State((graph_d.states[v], constraint.states[q].value))
+            for q, v in zip(qs, vs)
+        ],
+        matrices,
+        index(
+            np.repeat(constraint.start, len(graph_d.start)),
+            np.tile(graph_d.start, len(constraint.start)),
+        ),
+        np.flatnonzero(is_final[qs, vs]),
+    )
+    return product if decomposition else product.to_fa()
 
-    def nodes_to_indices(nodes: set):
-        """
-        Transforms set of graph nodes to list of bools
-        """
-        result = []
-        for n in graph_nodes:
-            if n in nodes:
-                result.append(True)
-            else:
-                result.append(False)
-        return result
 
-    def _indices_to_nodes(indices: list):
-        """
-        Transforms list of indices to set of graph nodes
-        """
-        indices = indices[matrix_size:]
-        result = set()
-        for i, v in enumerate(indices):
-            if v != 0:
-                result.add(graph_nodes[i])
-        return result
+class ReachablePairs:
+    """
+    Represents lazy collection of pairs [start state - final state] connected by a path in an automaton.
+    Pairs are stored in the matrix and are built only while iterating
+    """
 
-    matrix_size = len(constraint_m.keys())
-    unary_matrix = eye(matrix_size, dtype=bool)
+    __slots__ = ("matrix", "sources", "targets", "_indices")
 
-    def _transform_matrix(matrix: coo_matrix):
+    def __init__(self, matrix: csr_matrix, sources: list, targets: list):
         """
-        Transforms BFS front matrix to [E|M] form
+        :param matrix: Matrix [start state index - final state index]
+        :param sources: Start states
+        :param targets: Final states
         """
-        result = lil_matrix((matrix_size, matrix_size + len(graph_nodes)), dtype=bool)
-        result[0:matrix_size, 0:matrix_size] = unary_matrix
+        self.matrix = matrix
+        self.sources = sources
+        self.targets = targets
+        self._indices = None
 
-        t = matrix.copy()
-        t.resize((matrix_size, matrix_size))
-        for row, col in zip(*t.nonzero()):
-            result[col, matrix_size + 1 :] = matrix[row, matrix_size + 1 :]
-        return result
+    def __len__(self) -> int:
+        return self.matrix.nnz
 
-    result = defaultdict(set)
-    if separate_for_nodes:
-        for node in nodes:
-            front = hstack(
-                (unary_matrix, dok_matrix((matrix_size, len(graph_nodes)), dtype=bool)),
-                "csr",
-            )
-            for state in regexp_dfa.start_states:
-                front[constraint_nodes.index(state), matrix_size:] = nodes_to_indices(
-                    {node}
-                )
+    def __bool__(self) -> bool:
+        return self.matrix.nnz != 0
 
-            prev = None
-            while prev is None or (prev != front).sum() != 0:
-                prev = front.copy()
-                front[:] = 0
-                for m in matrices.values():
-                    t = prev @ m
-                    t = _transform_matrix(t)
-                    front += t
+    def __iter__(self):
+        indptr, indices = self.matrix.indptr, self.matrix.indices
+        for i, s in enumerate(self.sources):
+            for j in indices[indptr[i] : indptr[i + 1]]:
+                yield s, self.targets[j]
 
-                result[node].update(_indices_to_nodes(front.sum(0).tolist()[0]))
-    else:
-        front = hstack(
-            (
-                unary_matrix,
-                vstack(
-                    (
-                        nodes_to_indices(nodes),
-                        dok_matrix((matrix_size - 1, len(graph_nodes)), dtype=bool),
-                    )
-                ),
+    def __contains__(self, pair) -> bool:
+        if self._indices is None:
+            self._indices = (
+                {s: i for i, s in enumerate(self.sources)},
+                {f: j for j, f in enumerate(self.targets)},
             )
-        )
+        try:
+            s, f = pair
+            i, j = self._indices[0][s], self._indices[1][f]
+        except (KeyError, TypeError, ValueError):
+            return False
+        return bool(self.matrix[i, j])
 
-        prev = None
-        while (prev != front).sum() != 0:
-            prev = front.copy()
-            front[:] = 0
-            for m in matrices.values():
-                t = prev @ m
-                t = _transform_matrix(t)
-                front += t
+    def __repr__(self) -> str:
+        return "[" + ", ".join(map(repr, self)) + "]"
 
-            result[nodes].update(_indices_to_nodes(front.sum(0).tolist()[0]))
 
-    return result
+def reachable_pairs(d: BoolDecomposition) -> ReachablePairs:
+    """
+    Finds pairs [start state - final state] such that the final state is reachable from the start state,
+    the empty path is taken into account
+    :param d: Boolean decomposition of the automaton
+    :return: Lazy collection of the pairs
+    """
+    visited = _multiple_source_reachability(d)[:, d.final].tocsr()
+    visited.sum_duplicates()
+    return ReachablePairs(
+        visited, [d.states[i] for i in d.start], [d.states[i] for i in d.final]
+    )
 
 
-def bfs_query_graph_with_regexp(
-    graph, start: set, final: set, regexp: str
-) -> list[tuple]:
+def _union_decomposition(decompositions: list) -> tuple[BoolDecomposition, np.ndarray]:
     """
-    Runs a BFS and returns pairs [start vertex - final vertex] from graph that have the corresponding path with regexp constraint
-    :param graph: Graph representation of the NDFA
-    :param start: Start states of the NDFA. If None - all states are considered start states
-    :param final: Final states of the NDFA. If None - all states are considered final states
-    :param regexp: basic regexp string
-    :return: List of pairs [start vertex - final vertex] from graph that have the corresponding path with regexp constraint
+    Unites automata placing their states in disjoint blocks
+    :param decompositions: List of boolean decompositions
+    :return: Boolean decomposition of the union, its states are pairs [automaton index - state],
+    and array of the automaton index of every state
+    """
+    offsets = np.cumsum([0] + [d.size for d in decompositions])
+    size = int(offsets[-1])
+
+    rows = defaultdict(list)
+    cols = defaultdict(list)
+    for d, offset in zip(decompositions, offsets):
+        for symb, m in d.matrices.items():
+            r, c = m.nonzero()
+            rows[symb].append(r + offset)
+            cols[symb].append(c + offset)
+
+    matrices = dict()
+    for symb in rows.keys():
+        r, c = np.concatenate(rows[symb]), np.concatenate(cols[symb])
+        matrices[symb] = csr_matrix(
+            (np.ones(len(r), dtype=bool), (r, c)), shape=(size, size), dtype=bool
+        )
+
+    def concatenate(arrays: list) -> np.ndarray:
+        return np.concatenate(arrays) if arrays else np.zeros(0, dtype=np.int64)
+
+    union = BoolDecomposition(
+        [(t, s) for t, d in enumerate(decompositions) for s in d.states],
+        matrices,
+        concatenate([d.start + o for d, o in zip(decompositions, offsets)]),
+        concatenate([d.final + o for d, o in zip(decompositions, offsets)]),
+    )
+    tags = np.repeat(np.arange(len(decompositions)), [d.size for d in decompositions])
+    return union, tags
+
+
+def query_graph_with_regexps(
+    graph, start: set, final: set, regexps: list, backend="sparse"
+) -> dict[str, list[tuple]]:
     """
-    start = set(start)
+    Runs one BFS for several regexps and returns pairs [start vertex - final vertex] for each of them
+    :param graph: Graph representation of the NDFA, GraphIndex built for it or its boolean decomposition
+    :param start: Start vertices. If None - all vertices are considered start vertices
+    :param final: Final vertices. If None - all vertices are considered final vertices
+    :param regexps: List of basic regexp strings
+    :param backend: Boolean matrix backend name ("sparse", "bitpacked" or "auto") or class
+    :return: Dict of pairs [regexp - list of pairs [start vertex - final vertex] that have the corresponding path with regexp constraint]
+    """
+    graph_d = _graph_decomposition(graph)
+    if start is None:
+        start = graph_d.states
+    if final is None:
+        final = graph_d.states
+    start = list(start)
     final = set(final)
-    t = nodes_accesible_with_regexp_constraint(
-        start, graph, regexp, separate_for_nodes=True
+
+    regexps = list(dict.fromkeys(regexps))
+    union, tags = _union_decomposition(
+        [regex_cache.get(r, "regex")[1] for r in regexps]
     )
-    result = []
-    for k, v in t.items():
-        for r in v & final:
-            result.append((k, r))
+    k = union.size
 
-    return result
+    visited = _constrained_bfs(union, graph_d, [{s} for s in start], backend)
+    is_final = np.zeros(k, dtype=bool)
+    is_final[union.final] = True
+    reached = is_final[visited.row % k]
+
+    result = {r: dict() for r in regexps}
+    for row, col in zip(visited.row[reached], visited.col[reached]):
+        node = graph_d.states[col]
+        if node in final:
+            result[regexps[tags[row % k]]][(start[row // k], node)] = None
+
+    return {r: list(pairs) for r, pairs in result.items()}
@@ -1,7 +1,19 @@
+import hashlib
+import os
+import pickle
+import re
+import tempfile
 from collections import namedtuple
 import cfpq_data
 import networkx as nx
 
+from project.finite_automata_utils import (
+    BoolDecomposition,
+    GraphIndex,
+    load_bool_decomposition,
+    save_bool_decomposition,
+)
+
 GraphDescription = namedtuple(
     "GraphDescription", ["NumberOfNodes", "NumbreOfEdges", "Labels"]
 )
@@ -11,6 +23,265 @@ def get_graph(name):
     return cfpq_data.graph_from_csv(cfpq_data.download(name))
 
 
+def get_graph_decomposition(name, path):
+    """
+    Returns boolean decomposition of the graph from the dataset stored in the directory.
+    The graph is downloaded and decomposed only if the directory has no decomposition for it yet
+    :param name: Name of the graph in the dataset
+    :param path: Directory with decomposition files
+    :return: Boolean decomposition with lazily mapped label matrices
+    """
+    file = os.path.join(path, name + ".bdec")
+    if not os.path.isfile(file):
+        os.makedirs(path, exist_ok=True)
+        save_bool_decomposition(BoolDecomposition.from_graph(get_graph(name)), file)
+    return load_bool_decomposition(file)
+
+
+def _node(token: str):
+    """
+    Converts node id from the file to int if it is a number
+    """
+    return int(token) if re.fullmatch(r"-?[0-9]+", token) else token
+
+
+def read_edge_list(path):
+    """
+    Reads graph from the file with a "start final label" triple on every line,
+    separated by spaces, tabs or commas. Lines with two fields are edges without label.
+    Empty lines and lines starting with # are skipped
+    :param path: Path to the file
+    :return: Graph with labeled edges
+    """
+    graph = nx.MultiDiGraph()
+    with open(path) as file:
+        for number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            fields = re.split(r"[\s,]+", line, maxsplit=2)
+            if len(fields) < 2:
+                raise Exception(
+                    f'"{path}", line {number}: expected "start final label", got "{line}"'
+                )
+            v, u, label = fields if len(fields) == 3 else (*fields, None)
+            graph.add_edge(_node(v), _node(u), label=label)
+    return graph
+
+
+DOT_TOKEN = re.compile(
+    r'\s*(?:"(?P<str>(?:[^"\\]|\\.)*)"|(?P<comment>/\*|//)|(?P<op>->|--|[\[\]{};=,])'
+    r'|(?P<id>(?:[^\s\[\]{};=,"/-]|-(?![->])|/(?![*/]))+))'
+)
+DOT_KEYWORDS = {"graph", "node", "edge", "digraph", "strict", "subgraph"}
+
+
+def _dot_tokens(line: str, in_comment: bool = False) -> tuple:
+    """
+    Splits the line of the DOT file into pairs [kind - text] of kind "op", "id" or "str" for quoted strings.
+    Quoted strings are unescaped, comments are skipped
+    :param line: Line of the DOT file
+    :param in_comment: True if the line starts inside a /* */ comment
+    :return: Pair [list of tokens or None if the line has an unterminated string - True if the line ends inside a comment]
+    """
+    tokens = []
+    line = line.strip()
+    pos = 0
+    if not in_comment and line.startswith("#"):
+        return tokens, False
+    while pos < len(line):
+        if in_comment:
+            close = line.find("*/", pos)
+            if close == -1:
+                return tokens, True
+            pos, in_comment = close + 2, False
+            continue
+        token = DOT_TOKEN.match(line, pos)
+        if token is None:
+            return None, False
+        kind = token.lastgroup
+        text = token[kind]
+        pos = token.end()
+        if kind == "comment":
+            if text == "//":
+                break
+            in_comment = True
+            continue
+        tokens.append((kind, text.replace('\\"', '"') if kind == "str" else text))
+    return tokens, in_comment
+
+
+def _dot_statement(tokens: list) -> tuple:
+    """
+    Parses the node or edge statement written on one line
+    :param tokens: Tokens of the line returned by _dot_tokens
+    :return: Triple [node token - target node token or None - dict of attributes]
+    or None if the line is not such statement
+    """
+    if tokens[-1:] == [("op", ";")]:
+        tokens = tokens[:-1]
+
+    attrs = dict()
+    if tokens[-1:] == [("op", "]")]:
+        if ("op", "[") not in tokens:
+            return None
+        bracket = tokens.index(("op", "["))
+        body = tokens[bracket + 1 : -1]
+        tokens = tokens[:bracket]
+        i = 0
+        while i < len(body):
+            if body[i] in {("op", ","), ("op", ";")}:
+                i += 1
+                continue
+            key, eq, value = (body[i : i + 3] + [("op", "")] * 3)[:3]
+            if key[0] == "op" or eq != ("op", "=") or value[0] == "op":
+                return None
+            attrs[key[1]] = value[1]
+            i += 3
+
+    kinds = [kind for kind, _ in tokens]
+    if len(tokens) == 1 and kinds[0] != "op":
+        return tokens[0], None, attrs
+    if len(tokens) == 3 and tokens[1] == ("op", "->") and "op" not in kinds[::2]:
+        return tokens[0], tokens[2], attrs
+    return None
+
+
+def _read_dot_with_pydot(path):
+    """
+    Reads graph from the DOT file of any layout with pydot
+    :param path: Path to the file
+    :return: Graph with labeled edges
+    """
+    read = nx.nx_pydot.read_dot(path)
+    graph = nx.MultiDiGraph()
+    graph.add_nodes_from(_node(v) for v in read.nodes)
+    for v, u, label in read.edges(data="label"):
+        if label is not None and len(label) > 1 and label[0] == label[-1] == '"':
+            label = label[1:-1].replace('\\"', '"')
+        graph.add_edge(_node(v), _node(u), label=label)
+    return graph
+
+
+def read_dot(path):
+    """
+    Reads graph from the DOT file line by line if every node and edge statement is on a separate line,
+    as written by networkx. Comments are skipped, files with other statements are read with pydot
+    :param path: Path to the file
+    :return: Graph with labeled edges
+    """
+    graph = nx.MultiDiGraph()
+    in_comment = False
+    with open(path) as file:
+        for line in file:
+            tokens, in_comment = _dot_tokens(line, in_comment)
+            if tokens is None:
+                return _read_dot_with_pydot(path)
+            statement = _dot_statement(tokens) if tokens else None
+            if statement is None:
+                if any(("op", op) in tokens for op in ("->", "--", "[", "]")):
+                    return _read_dot_with_pydot(path)
+                continue
+            v, u, attrs = statement
+            if u is not None:
+                graph.add_edge(_node(v[1]), _node(u[1]), label=attrs.get("label"))
+            elif v[0] == "str" or v[1] not in DOT_KEYWORDS:
+                graph.add_node(_node(v[1]))
+    return graph
+
+
+GRAPH_READERS = {
+    ".csv": read_edge_list,
+    ".txt": read_edge_list,
+    ".edges": read_edge_list,
+    ".dot": read_dot,
+    ".gv": read_dot,
+}
+
+
+def read_graph(path):
+    """
+    Reads graph from the local file choosing the reader from GRAPH_READERS by the file extension
+    :param path: Path to the file
+    :return: Graph with labeled edges
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in GRAPH_READERS:
+        raise Exception(f'No graph reader for "{extension}" files')
+    return GRAPH_READERS[extension](path)
+
+
+class GraphStore:
+    """
+    Represents graphs loaded from local files or from the dataset.
+    Every graph is parsed once per process and indexed once, parsed graphs are also kept in the optional
+    on-disk store under the hash of the file content
+    """
+
+    def __init__(self, path: str = None):
+        """
+        :param path: Directory of the on-disk store. If None - graphs are kept only in memory
+        """
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._indices = dict()
+
+    def get(self, source: str) -> GraphIndex:
+        """
+        Returns index of the graph, repeated calls for the unchanged source return the same index
+        :param source: Path to the local graph file or name of the graph in the dataset
+        :return: Index of the graph
+        """
+        is_file = os.path.isfile(source)
+        if is_file:
+            stat = os.stat(source)
+            memo_key = (os.path.abspath(source), stat.st_size, stat.st_mtime_ns)
+        else:
+            memo_key = source
+        if memo_key in self._indices:
+            self.hits += 1
+            return self._indices[memo_key]
+
+        if is_file:
+            digest = hashlib.sha256()
+            with open(source, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+            digest.update(os.path.splitext(source)[1].lower().encode())
+            key = digest.hexdigest()
+        else:
+            key = hashlib.sha256(("dataset:" + source).encode()).hexdigest()
+
+        file = os.path.join(self.path, key + ".pickle") if self.path else None
+        if file is not None and os.path.isfile(file):
+            self.hits += 1
+            with open(file, "rb") as f:
+                graph = pickle.load(f)
+        else:
+            self.misses += 1
+            graph = read_graph(source) if is_file else get_graph(source)
+            if file is not None:
+                os.makedirs(self.path, exist_ok=True)
+                with tempfile.NamedTemporaryFile(
+                    "wb", dir=self.path, delete=False
+                ) as f:
+                    pickle.dump(graph, f)
+                os.replace(f.name, file)
+
+        self._indices[memo_key] = GraphIndex(graph)
+        return self._indices[memo_key]
+
+    def clear(self):
+        """
+        Removes all graphs from memory. The on-disk store is kept
+        """
+        self._indices.clear()
+
+
+graph_store = GraphStore()
+
+
 def describe_graph(graph):
     labels = set(label for _, _, label in graph.edges(data="label"))
     return GraphDescription(graph.number_of_nodes(), graph.number_of_edges(), labels)
@@ -2,8 +2,7 @@ import networkx as nx
 from pyformlang.finite_automaton import *
 from pyformlang.regular_expression import *
 
-import project.finite_automata_utils as fau
-import project.graph_utils as gu
+from project.automaton_plan import *
 from gen.GramParser import GramParser
 from gen.GramVisitor import GramVisitor
 
@@ -16,8 +15,27 @@ class Visitor(GramVisitor):
         def __init__(self, val: str):
             self.value = val
 
+    class Stream:
+        """
+        Lazy result of map and filter, elements are computed on every iteration
+        """
+
+        def __init__(self, source, func: callable, is_filter: bool = False):
+            self.source = source
+            self.func = func
+            self.is_filter = is_filter
+
+        def __iter__(self):
+            if self.is_filter:
+                return (i for i in self.source if self.func(i))
+            return map(self.func, self.source)
+
+        def __repr__(self):
+            return repr(list(self))
+
     def __init__(self):
         self.vars = dict()
+        self.lambdas = dict()
 
     def extractExprResult(self, expr_ctx):
         if expr_ctx is None:
@@ -51,90 +69,39 @@ class Visitor(GramVisitor):
 
         op = op_c.accept(self)
 
-        if not isinstance(expr1_r, EpsilonNFA):
+        if not isinstance(expr1_r, AutomatonPlan):
             raise Exception(f'Type {type(expr1_r)} is not valid for "{op}" operation')
 
-        if op == "set_final":
-            if not isinstance(expr2_r, set):
-                raise Exception(
-                    f'Type {type(expr2_r)} is not valid for "{op}" operation'
-                )
-            expr1_r = expr1_r.copy()
-            expr1_r.final_states.clear()
-            expr1_r.final_states.update(expr2_r)
-
-        elif op == "set_start":
+        if op in StartFinalPlan.OPERATIONS:
             if not isinstance(expr2_r, set):
                 raise Exception(
                     f'Type {type(expr2_r)} is not valid for "{op}" operation'
                 )
-            expr1_r = expr1_r.copy()
-            expr1_r.start_states.clear()
-            expr1_r.start_states.update(expr2_r)
-
-        elif op == "add_start":
-            if not isinstance(expr2_r, set):
-                raise Exception(
-                    f'Type {type(expr2_r)} is not valid for "{op}" operation'
-                )
-            expr1_r = expr1_r.copy()
-            expr1_r.start_states.update(expr2_r)
-
-        elif op == "add_final":
-            if not isinstance(expr2_r, set):
-                raise Exception(
-                    f'Type {type(expr2_r)} is not valid for "{op}" operation'
-                )
-            expr1_r = expr1_r.copy()
-            expr1_r.final_states.update(expr2_r)
-
-        elif op == "get_start":
-            if expr2_r is not None:
-                raise Exception(f'No argument is needed in "{op}" operation')
-            return set(expr1_r.start_states)
-
-        elif op == "get_final":
+            return StartFinalPlan(expr1_r, op, expr2_r)
+
+        elif op in {
+            "get_start",
+            "get_final",
+            "get_reachable",
+            "get_vertices",
+            "get_edges",
+            "get_labels",
+        }:
             if expr2_r is not None:
                 raise Exception(f'No argument is needed in "{op}" operation')
-            return set(expr1_r.final_states)
-
-        elif op == "get_reachable":
-            if expr2_r is not None:
-                raise Exception(f'No argument is needed in "{op}" operation')
-
-            t: nx.MultiDiGraph = nx.transitive_closure(
-                nx.DiGraph(expr1_r.to_networkx())
-            )
-            return t.edges
-
-        elif op == "get_vertices":
-            if expr2_r is not None:
-                raise Exception(f'No argument is needed in "{op}" operation')
-            return set(expr1_r.states)
-
-        elif op == "get_edges":
-            if expr2_r is not None:
-                raise Exception(f'No argument is needed in "{op}" operation')
-            return set(expr1_r)
-
-        elif op == "get_labels":
-            if expr2_r is not None:
-                raise Exception(f'No argument is needed in "{op}" operation')
-            return set(expr1_r.symbols)
+            return getattr(expr1_r, op)()
 
         else:
             raise Exception("You should not be here")
 
-        return expr1_r
-
     # Visit a parse tree produced by GramParser#intersect.
     def visitIntersect(self, ctx: GramParser.IntersectContext):
         expr1_c, expr2_c = ctx.expr()
         g1 = self.extractExprResult(expr1_c)
         g2 = self.extractExprResult(expr2_c)
 
-        if isinstance(g1, EpsilonNFA) and isinstance(g2, EpsilonNFA):
-            return g1.get_intersection(g2)
+        if isinstance(g1, AutomatonPlan) and isinstance(g2, AutomatonPlan):
+            return IntersectPlan(g1, g2)
         elif isinstance(g1, set) and isinstance(g2, set):
             return g1 & g2
         else:
@@ -148,10 +115,12 @@ class Visitor(GramVisitor):
         g1 = self.extractExprResult(expr1_c)
         g2 = self.extractExprResult(expr2_c)
 
-        if isinstance(g1, EpsilonNFA) and isinstance(g2, EpsilonNFA):
-            return g1.concatenate(g2)
-        elif isinstance(g1, list) and isinstance(g2, list):
-            return g1 + g2
+        if isinstance(g1, AutomatonPlan) and isinstance(g2, AutomatonPlan):
+            return ConcatPlan(g1, g2)
+        elif isinstance(g1, (list, Visitor.Stream)) and isinstance(
+            g2, (list, Visitor.Stream)
+        ):
+            return list(g1) + list(g2)
         elif isinstance(g1, str) and isinstance(g2, str):
             return g1 + g2
         else:
@@ -165,8 +134,8 @@ class Visitor(GramVisitor):
         g1 = self.extractExprResult(expr1_c)
         g2 = self.extractExprResult(expr2_c)
 
-        if isinstance(g1, EpsilonNFA) and isinstance(g2, EpsilonNFA):
-            return g1.union(g2)
+        if isinstance(g1, AutomatonPlan) and isinstance(g2, AutomatonPlan):
+            return UnionPlan(g1, g2)
         elif isinstance(g1, set) and isinstance(g2, set):
             return g1 | g2
         else:
@@ -179,10 +148,10 @@ class Visitor(GramVisitor):
         expr_c = ctx.expr()
         g = self.extractExprResult(expr_c)
 
-        if not isinstance(g, EpsilonNFA):
+        if not isinstance(g, AutomatonPlan):
             raise Exception(f"Type {type(g)} is not valid for star operation")
 
-        return g.kleene_star()
+        return StarPlan(g)
 
     # Visit a parse tree produced by GramParser#var.
     def visitVar(self, ctx: GramParser.VarContext):
@@ -191,17 +160,15 @@ class Visitor(GramVisitor):
     # Visit a parse tree produced by GramParser#symb.
     def visitSymb(self, ctx: GramParser.SymbContext):
         str_c = ctx.STRING()
-        symb = str_c.getText()
-        result: EpsilonNFA = Regex(symb).to_epsilon_nfa()
-        return result
+        return SymbolPlan(str_c.getText())
 
     # Visit a parse tree produced by GramParser#print.
     def visitPrint(self, ctx: GramParser.PrintContext):
         expr_c: GramParser.ExprContext = ctx.expr()
         expr_r = self.extractExprResult(expr_c)
 
-        if isinstance(expr_r, EpsilonNFA):
-            print(nx.nx_pydot.to_pydot(expr_r.to_networkx()).to_string())
+        if isinstance(expr_r, AutomatonPlan):
+            print(nx.nx_pydot.to_pydot(expr_r.to_fa().to_networkx()).to_string())
         else:
             print(expr_r)
 
@@ -209,12 +176,17 @@ class Visitor(GramVisitor):
     def visitBind(self, ctx: GramParser.BindContext):
         id_c: GramParser.IdContext = ctx.id_()
         expr_c: GramParser.ExprContext = ctx.expr()
-        self.vars[id_c.accept(self).value] = self.extractExprResult(expr_c)
+        expr_r = self.extractExprResult(expr_c)
+
+        # Lambdas see the current values of the variables, so the stream is computed before they change
+        if isinstance(expr_r, Visitor.Stream):
+            expr_r = list(expr_r)
+        self.vars[id_c.accept(self).value] = expr_r
 
     # Visit a parse tree produced by GramParser#load.
     def visitLoad(self, ctx: GramParser.LoadContext):
         path_c: GramParser.StringContext = ctx.v()
-        return fau.build_NDFA_from_graph(gu.get_graph(path_c.accept(self)))
+        return LoadPlan(path_c.accept(self))
 
     # Visit a parse tree produced by GramParser#map.
     def visitMap(self, ctx: GramParser.MapContext):
@@ -232,7 +204,7 @@ class Visitor(GramVisitor):
 
         lam: callable = lambda_c.accept(self)
 
-        return lam(s)
+        return Visitor.Stream(s, lam)
 
     # Visit a parse tree produced by GramParser#filter.
     def visitFilter(self, ctx: GramParser.FilterContext):
@@ -250,34 +222,24 @@ class Visitor(GramVisitor):
 
         lam: callable = lambda_c.accept(self)
 
-        result = []
-        for flag, val in zip(lam(s), s):
-            if flag:
-                result.append(val)
-        return result
+        return Visitor.Stream(s, lam, is_filter=True)
 
     # Visit a parse tree produced by GramParser#lambda.
     def visitLambda(self, ctx: GramParser.LambdaContext):
         id_c: GramParser.IdContext = ctx.id_()
         code_c = ctx.CODE()
 
-        id = id_c.accept(self)
-        code = code_c.getText().strip("{{").strip("}}")
-
-        def func(s):
-            result = list()
-            for i in s:
-                context = dict()
-                context["__param__"] = i
-                exec(
-                    f"__result__ = (lambda {id.value}:{code})(__param__)",
-                    self.vars,
-                    context,
-                )
-                result.append(context["__result__"])
-            return result
+        # The lambda is compiled once, its globals are the variables so it sees their current values
+        if ctx not in self.lambdas:
+            id = id_c.accept(self)
+            code = code_c.getText().strip("{{").strip("}}")
+            # The newline ends a trailing comment of the body before the closing parenthesis
+            self.lambdas[ctx] = eval(
+                compile(f"lambda {id.value}:({code}\n)", "<lambda>", "eval"),
+                self.vars,
+            )
 
-        return func
+        return self.lambdas[ctx]
 
     # Visit a parse tree produced by GramParser#id.
     def visitId(self, ctx: GramParser.IdContext):
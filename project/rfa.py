@@ -4,7 +4,7 @@ from pyformlang.finite_automaton import EpsilonNFA
 
 from scipy.sparse import *
 
-from project.finite_automata_utils import convert_FA_to_matrix_form
+from project.finite_automata_utils import BoolDecomposition
 
 
 class RFA:
@@ -22,13 +22,14 @@ class RFA:
         self.start = start
         self.transitions = transitions if transitions is not None else {}
 
-    def to_matrix_form(self):
+    def to_matrix_form(self) -> dict[State, BoolDecomposition]:
         """
         Creates a boolean decomposition of the RFA
+        :return: Dict of pairs [nonterminal - boolean decomposition of its box]
         """
         result = dict()
         for s, nfa in self.transitions.items():
-            result[s] = convert_FA_to_matrix_form(nfa)
+            result[s] = BoolDecomposition.from_fa(nfa)
 
         return result
 
@@ -0,0 +1,106 @@
+import pytest
+import networkx as nx
+
+import project.finite_automata_utils as fa_utils
+import project.graph_utils as g_utils
+from project.automaton_plan import *
+
+
+def setup_module(module):
+    ...
+
+
+def teardown_module(module):
+    ...
+
+
+@pytest.fixture
+def graph(monkeypatch):
+    graph = nx.MultiDiGraph()
+    nx.add_path(graph, [0, 1, 2, 3], label="a")
+    graph.add_edge(3, 0, label="b")
+    graph.add_edge(1, 4, label="b")
+    monkeypatch.setattr(g_utils, "get_graph", lambda name: graph)
+    monkeypatch.setattr(g_utils, "graph_store", g_utils.GraphStore())
+    return graph
+
+
+def test_plan_is_lazy(graph):
+    regex = StarPlan(UnionPlan(SymbolPlan("a"), SymbolPlan("b")))
+    plan = IntersectPlan(StartFinalPlan(LoadPlan("graph"), "set_start", {0}), regex)
+
+    assert regex.regex() == "((a)|(b))*"
+    assert plan._fa is None
+    assert StartFinalPlan(LoadPlan("graph"), "set_start", {0}).get_start() == {0}
+    assert LoadPlan("graph").get_labels() == {"a", "b"}
+
+    plan.get_final()
+    assert plan._decomposition is not None and plan._fa is None
+    assert plan.left._fa is None and regex._fa is None
+
+
+def test_fused_intersect(graph):
+    regex = ConcatPlan(SymbolPlan("a"), StarPlan(SymbolPlan("a")))
+    g = StartFinalPlan(LoadPlan("graph"), "set_start", {0, 1})
+    plan = IntersectPlan(g, regex)
+
+    assert {s.value[0] for s in plan.get_start()} == {0, 1}
+    assert {s.value[0] for s in plan.get_final()} == {1, 2, 3}
+    assert {s.value[0] for s in plan.get_vertices()} == {0, 1, 2, 3}
+
+    expected = fa_utils.build_NDFA_from_graph(graph, {0, 1}).get_intersection(
+        fa_utils.build_DFA_from_regexp("a a*")
+    )
+    assert plan.to_fa().is_equivalent_to(expected)
+
+
+def test_fused_intersect_regex_on_the_left(graph):
+    regex = ConcatPlan(SymbolPlan("a"), StarPlan(SymbolPlan("a")))
+    g = StartFinalPlan(LoadPlan("graph"), "set_start", {0, 1})
+    plan = IntersectPlan(regex, g)
+
+    assert plan.fused() is not None
+    assert {s.value[1] for s in plan.get_start()} == {0, 1}
+    assert {s.value[1] for s in plan.get_final()} == {1, 2, 3}
+    assert {s.value[1] for s in plan.to_fa().states} == {0, 1, 2, 3}
+
+    expected = fa_utils.build_DFA_from_regexp("a a*").get_intersection(
+        fa_utils.build_NDFA_from_graph(graph, {0, 1})
+    )
+    assert plan.to_fa().is_equivalent_to(expected)
+
+
+def test_iterate_over_plan(graph):
+    g = LoadPlan("graph")
+
+    assert set(g) == set(g.to_fa())
+    assert {(s.value, f.value) for s, symb, f in g if symb == "b"} == {(3, 0), (1, 4)}
+    assert len(list(IntersectPlan(g, SymbolPlan("b")))) == 2
+
+
+def test_intersect(graph):
+    g = StartFinalPlan(
+        StartFinalPlan(LoadPlan("graph"), "set_start", {0}), "set_final", {3}
+    )
+    plan = IntersectPlan(g, StartFinalPlan(g, "add_start", {1}))
+
+    assert {s.value for s in plan.get_start()} == {(0, 0), (0, 1)}
+    assert {s.value for s in plan.get_final()} == {(3, 3)}
+    assert plan.to_fa().accepts(["a", "a", "a"])
+    assert not plan.to_fa().accepts(["a", "a"])
+
+
+def test_get_reachable(graph):
+    g = StartFinalPlan(LoadPlan("graph"), "set_start", {0, 4})
+    reachable = g.get_reachable()
+
+    assert len(reachable) == 6
+    assert set(reachable) == {(0, 0), (0, 1), (0, 2), (0, 3), (0, 4), (4, 4)}
+    assert (4, 0) not in reachable
+
+    plan = IntersectPlan(g, ConcatPlan(SymbolPlan("a"), SymbolPlan("b")))
+    assert {(s.value[0], f.value[0]) for s, f in plan.get_reachable()} == {(0, 4)}
+    assert plan._fa is None
+
+    regex = StarPlan(SymbolPlan("a"))
+    assert len(regex.get_reachable()) == 1
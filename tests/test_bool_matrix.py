@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix
+
+import project.bool_matrix as bm
+
+
+def setup_module(module):
+    ...
+
+
+def teardown_module(module):
+    ...
+
+
+def random_matrix(shape, density, seed):
+    return csr_matrix(np.random.default_rng(seed).random(shape) < density)
+
+
+@pytest.mark.parametrize("backend", [bm.SparseBackend, bm.BitPackedBackend])
+def test_backend_operations(backend):
+    a = random_matrix((70, 90), 0.3, 1)
+    b = random_matrix((90, 65), 0.05, 2)
+    c = random_matrix((70, 90), 0.5, 3)
+
+    ba, bb, bc = map(backend.from_sparse, (a, b, c))
+
+    def check(result, expected):
+        assert (backend.to_sparse(result) != csr_matrix(expected, dtype=bool)).nnz == 0
+
+    check(backend.multiply(ba, bb), (a @ b).toarray())
+    check(backend.add(ba, bc), a.toarray() | c.toarray())
+    check(backend.difference(ba, bc), a.toarray() & ~c.toarray())
+    check(backend.kron(bb, bc), np.kron(b.toarray(), c.toarray()))
+    check(backend.transpose(ba), a.toarray().T)
+
+    assert backend.nnz(ba) == a.nnz
+    assert backend.equal(ba, backend.from_sparse(a.copy()))
+    assert not backend.equal(ba, bc)
+    assert backend.nnz(backend.zeros((3, 200))) == 0
+
+
+def test_get_backend():
+    assert bm.get_backend() is bm.SparseBackend
+    assert bm.get_backend("bitpacked") is bm.BitPackedBackend
+    assert bm.get_backend("auto", 0.5) is bm.BitPackedBackend
+    assert bm.get_backend("auto", 0.001) is bm.SparseBackend
+    with pytest.raises(Exception):
+        bm.get_backend("gpu")
@@ -4,6 +4,7 @@ import tempfile
 from pyformlang.cfg import Variable, Terminal, Epsilon, CFG
 
 import project.cfg_utils as c_utils
+from project.ecfg import ECFG
 import networkx as nx
 
 
@@ -59,6 +60,29 @@ def test_wnf():
         os.remove(name)
 
 
+def test_wcnf_cache():
+    cache = c_utils.WCNFCache(maxsize=1)
+    cfg = CFG.from_text("S -> A B\n A -> a\n B -> b")
+    same_cfg = CFG.from_text("B -> b\n S -> A B\n A -> a")
+    other_cfg = CFG.from_text("S -> a S b | a b")
+
+    wcnf = cache.get(cfg)
+    assert cache.get(same_cfg) is wcnf
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    cache.get(other_cfg)
+    cache.get(cfg)
+    assert (cache.hits, cache.misses) == (1, 3)
+
+    with tempfile.TemporaryDirectory() as path:
+        c_utils.WCNFCache(path=path).get(cfg)
+
+        cache = c_utils.WCNFCache(path=path)
+        wcnf = cache.get(same_cfg)
+        assert (cache.hits, cache.misses) == (1, 0)
+        assert set(wcnf.productions) == set(c_utils.to_wcnf(cfg).productions)
+
+
 def test_matrix_alg():
     cfg = CFG.from_text("S->A B\n S -> A S1\n S1->S B\n A->a\n B->b")
     graph = nx.MultiDiGraph()
@@ -84,3 +108,215 @@ def test_hellings():
 
     result = c_utils.query_hellings(graph, cfg)
     assert result == {(0, 2), (0, 3), (1, 2), (1, 3), (2, 2), (2, 3)}
+
+
+def test_matrix_alg_semi_naive():
+    cfg = CFG.from_text("S->A B\n S -> A S1\n S1->S B\n A->a\n B->b")
+    graph = nx.MultiDiGraph()
+    graph.add_edge(0, 1, label="a")
+    graph.add_edge(1, 2, label="a")
+    graph.add_edge(2, 0, label="a")
+    graph.add_edge(2, 3, label="b")
+    graph.add_edge(3, 2, label="b")
+
+    naive = c_utils.matrix_alg(graph, cfg, semi_naive=False)
+    semi_naive = c_utils.matrix_alg(graph, cfg, semi_naive=True)
+
+    for n, m in naive.items():
+        if m.nnz != 0:
+            assert (m != semi_naive[n]).nnz == 0
+
+
+def test_hellings_epsilon():
+    cfg = CFG.from_text("S -> a S b S\n S -> $")
+    graph = nx.MultiDiGraph()
+    graph.add_edge(0, 1, label="a")
+    graph.add_edge(1, 2, label="b")
+    graph.add_edge(2, 0, label="a")
+
+    result = c_utils.query_hellings(graph, cfg)
+    assert result == {(0, 0), (1, 1), (2, 2), (0, 2)}
+    assert result == c_utils.query_matrix(graph, cfg)
+
+
+def test_tensor():
+    cfg = CFG.from_text("S->A B\n S -> A S1\n S1->S B\n A->a\n B->b")
+    graph = nx.MultiDiGraph()
+    graph.add_edge(0, 1, label="a")
+    graph.add_edge(1, 2, label="a")
+    graph.add_edge(2, 0, label="a")
+    graph.add_edge(2, 3, label="b")
+    graph.add_edge(3, 2, label="b")
+
+    result = c_utils.query_tensor(graph, cfg)
+    assert result == {(0, 2), (0, 3), (1, 2), (1, 3), (2, 2), (2, 3)}
+
+    result = c_utils.query_tensor(graph, cfg, start={0}, final={3})
+    assert result == {(0, 3)}
+
+
+def test_tensor_nullable():
+    cfg = CFG.from_text("S -> A B\nA -> a A | $\nB -> b B | b")
+    graph = nx.MultiDiGraph()
+    graph.add_nodes_from([0, 1])
+    graph.add_edge(0, 1, label="a")
+
+    assert c_utils.query_tensor(graph, cfg) == set()
+
+    graph.add_edge(1, 0, label="b")
+    assert c_utils.query_tensor(graph, cfg) == {(0, 0), (1, 0)}
+
+
+def test_tensor_ecfg():
+    ecfg = ECFG.read_from_text("S -> a S* b")
+    graph = nx.MultiDiGraph()
+    graph.add_edge("x", "y", label="a")
+    graph.add_edge("y", "z", label="a")
+    graph.add_edge("z", "w", label="b")
+    graph.add_edge("w", "v", label="b")
+
+    result = c_utils.query_tensor(graph, ecfg)
+    assert result == {("y", "w"), ("x", "v")}
+
+
+def test_matrix_alg_arbitrary_nodes():
+    cfg = CFG.from_text("S->A B\n S -> A S1\n S1->S B\n A->a\n B->b")
+    graph = nx.MultiDiGraph()
+    graph.add_edge("x", 100, label="a")
+    graph.add_edge(100, "z", label="a")
+    graph.add_edge("z", "x", label="a")
+    graph.add_edge("z", 7, label="b")
+    graph.add_edge(7, "z", label="b")
+
+    result = c_utils.query_matrix(graph, cfg)
+    assert result == {
+        ("x", "z"),
+        ("x", 7),
+        (100, "z"),
+        (100, 7),
+        ("z", "z"),
+        ("z", 7),
+    }
+
+
+def test_multiple_source_matrix_alg():
+    cfg = CFG.from_text("S->A B\n S -> A S1\n S1->S B\n A->a\n B->b")
+    graph = nx.MultiDiGraph()
+    graph.add_edge(0, 1, label="a")
+    graph.add_edge(1, 2, label="a")
+    graph.add_edge(2, 0, label="a")
+    graph.add_edge(2, 3, label="b")
+    graph.add_edge(3, 2, label="b")
+
+    result = c_utils.multiple_source_matrix_alg(graph, cfg, {1})
+    s = result[Variable("S")]
+    assert set(s[1].nonzero()[1]) == {2, 3}
+    assert s[3].nnz == 0
+
+    assert c_utils.query_matrix(graph, cfg, start={1, 2}) == {
+        (1, 2),
+        (1, 3),
+        (2, 2),
+        (2, 3),
+    }
+
+
+def test_multiple_source_matrix_alg_matches_all_pairs():
+    graph = nx.MultiDiGraph()
+    graph.add_nodes_from(range(300))
+    for v, u in nx.gnm_random_graph(300, 600, seed=7, directed=True).edges:
+        graph.add_edge(v, u, label="ab"[(v * 7 + u) % 2])
+    start = {0, 5, 17, 42, 99, 150, 299}
+
+    for text in (
+        "S -> a S b S\n S -> $",
+        "S -> S S | a | b",
+        "S -> a B\n B -> b | B a",
+    ):
+        cfg = CFG.from_text(text)
+        all_pairs = c_utils.matrix_alg(graph, cfg)
+        result = c_utils.multiple_source_matrix_alg(graph, cfg, start)
+
+        for n, m in result.items():
+            for v in set(m.nonzero()[0]):
+                assert (m[v] != all_pairs[n][v]).nnz == 0
+        rows = sorted(start)
+        assert (
+            result[cfg.start_symbol][rows] != all_pairs[cfg.start_symbol][rows]
+        ).nnz == 0
+        assert c_utils.query_matrix(graph, cfg, start=start) == {
+            (v, u) for v, u in zip(*all_pairs[cfg.start_symbol].nonzero()) if v in start
+        }
+
+
+def test_matrix_alg_backends():
+    cfg = CFG.from_text("S -> a S b S\n S -> $")
+    graph = nx.MultiDiGraph()
+    for i in range(10):
+        graph.add_edge(i, (i + 1) % 10, label="a" if i % 3 else "b")
+        graph.add_edge(i, (i + 3) % 10, label="b")
+
+    expected = c_utils.matrix_alg(graph, cfg, backend="sparse")
+    for semi_naive in [True, False]:
+        for backend in ["sparse", "bitpacked", "auto"]:
+            result = c_utils.matrix_alg(graph, cfg, semi_naive, backend)
+            for n, m in expected.items():
+                assert (m != result[n]).nnz == 0
+
+
+def test_matrix_alg_workers():
+    cfg = CFG.from_text("S -> a S b S\n S -> $")
+    graph = nx.MultiDiGraph()
+    for i in range(10):
+        graph.add_edge(i, (i + 1) % 10, label="a" if i % 3 else "b")
+        graph.add_edge(i, (i + 3) % 10, label="b")
+
+    expected = c_utils.matrix_alg(graph, cfg)
+    for semi_naive in [True, False]:
+        result = c_utils.matrix_alg(graph, cfg, semi_naive, workers=4)
+        for n, m in expected.items():
+            assert (m != result[n]).nnz == 0
+
+
+def test_gll():
+    cfg = CFG.from_text("S->A B\n S -> A S1\n S1->S B\n A->a\n B->b")
+    graph = nx.MultiDiGraph()
+    graph.add_edge(0, 1, label="a")
+    graph.add_edge(1, 2, label="a")
+    graph.add_edge(2, 0, label="a")
+    graph.add_edge(2, 3, label="b")
+    graph.add_edge(3, 2, label="b")
+
+    result = c_utils.query_gll(graph, cfg)
+    assert result == {(0, 2), (0, 3), (1, 2), (1, 3), (2, 2), (2, 3)}
+
+    assert c_utils.query_gll(graph, cfg, start={1}) == {(1, 2), (1, 3)}
+    assert c_utils.query_gll(graph, ECFG.from_CFG(cfg), start={1}, final={3}) == {
+        (1, 3)
+    }
+
+
+def test_gll_nullable():
+    ecfg = ECFG.read_from_text("S -> (a S b)*")
+    graph = nx.MultiDiGraph()
+    graph.add_edge(0, 1, label="a")
+    graph.add_edge(1, 2, label="b")
+    graph.add_edge(2, 0, label="a")
+
+    assert c_utils.query_gll(graph, ecfg, start={0}) == {(0, 0), (0, 2)}
+
+
+def test_nonterminal_named_label():
+    cfg = CFG.from_text("S -> a B\n B -> b")
+    graph = nx.MultiDiGraph()
+    graph.add_edge(0, 1, label="a")
+    graph.add_edge(1, 2, label="B")
+    graph.add_edge(1, 3, label="b")
+
+    expected = {(0, 3)}
+    assert c_utils.query_gll(graph, cfg) == expected
+    assert c_utils.query_gll(graph, ECFG.from_CFG(cfg), start={0}) == expected
+    assert c_utils.query_tensor(graph, cfg) == expected
+    assert c_utils.query_hellings(graph, cfg) == expected
+    assert c_utils.query_matrix(graph, cfg) == expected
+    assert c_utils.query_matrix(graph, cfg, start={0}) == expected
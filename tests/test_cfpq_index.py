@@ -0,0 +1,45 @@
+import networkx as nx
+from pyformlang.cfg import CFG
+
+import project.cfg_utils as c_utils
+from project.cfpq_index import CFPQIndex
+
+
+def setup_module(module):
+    ...
+
+
+def teardown_module(module):
+    ...
+
+
+def test_add_edges():
+    cfg = CFG.from_text("S->A B\n S -> A S1\n S1->S B\n A->a\n B->b")
+    graph = nx.MultiDiGraph()
+    graph.add_edge(0, 1, label="a")
+    graph.add_edge(1, 2, label="a")
+    graph.add_edge(2, 0, label="a")
+
+    index = CFPQIndex(graph, cfg)
+    assert index.query() == set()
+
+    index.add_edges([(2, 3, "b"), (3, 2, "b")])
+    graph.add_edge(2, 3, label="b")
+    graph.add_edge(3, 2, label="b")
+
+    assert index.query() == {(0, 2), (0, 3), (1, 2), (1, 3), (2, 2), (2, 3)}
+    assert index.query() == c_utils.query_hellings(graph, cfg)
+    assert index.query(start={1}, final={3}) == {(1, 3)}
+    assert index.reachable(0, 3)
+    assert not index.reachable(3, 0)
+
+
+def test_add_edges_new_nodes():
+    cfg = CFG.from_text("S -> a S b S\n S -> $")
+    index = CFPQIndex(nx.MultiDiGraph(), cfg)
+
+    index.add_edges([("x", "y", "a")])
+    assert index.query() == {("x", "x"), ("y", "y")}
+
+    index.add_edges([("y", "z", "b")])
+    assert index.query() == {("x", "x"), ("y", "y"), ("z", "z"), ("x", "z")}
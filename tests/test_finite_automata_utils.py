@@ -1,9 +1,12 @@
 import pytest
 import pydot
 import project.finite_automata_utils as fa_utils
+from pyformlang.finite_automaton import State
 from pyformlang.regular_expression import *
 import project.graph_utils as g_utils
 import networkx as nx
+import numpy as np
+from scipy.sparse import csr_matrix
 
 
 def setup_module(module):
@@ -106,3 +109,318 @@ def test_bfs_query_graph_with_python_regexp():
     result = fa_utils.bfs_query_graph_with_regexp(graph, start, final, regexp)
 
     assert set(result) == {(1, 4), (2, 5)}
+
+
+def test_intersect_fa_bitpacked():
+    fa1 = fa_utils.build_DFA_from_python_regexp("Hello.*")
+    fa2 = fa_utils.build_DFA_from_python_regexp(".* world!")
+    fai = fa_utils.intersect_FA(fa1, fa2, backend="bitpacked")
+
+    assert fai.accepts("Hello world!")
+    assert not fai.accepts("Hello")
+    assert fa1.get_intersection(fa2).is_equivalent_to(fai)
+
+
+def test_bfs_query_graph_with_regexp_cycles():
+    graph = nx.MultiDiGraph()
+    graph.add_edge(0, 1, label="a")
+    graph.add_edge(1, 2, label="b")
+    graph.add_edge(2, 1, label="b")
+    graph.add_edge(2, 3, label="a")
+
+    for backend in ["sparse", "bitpacked", "auto"]:
+        result = fa_utils.nodes_accesible_with_regexp_constraint(
+            {0}, graph, "a b b*", separate_for_nodes=True, backend=backend
+        )
+        assert result == {0: {1, 2}}
+
+    for backend in ["sparse", "bitpacked", "auto"]:
+        result = fa_utils.bfs_query_graph_with_regexp(
+            graph, {0, 1}, {3}, "a* b* a", backend=backend
+        )
+        assert set(result) == {(0, 3), (1, 3)}
+        assert fa_utils.exists_path(graph, 0, 3, "a b* a", backend=backend)
+
+
+def test_bool_decomposition():
+    dfa = fa_utils.build_DFA_from_regexp("a b* c")
+    d = fa_utils.BoolDecomposition.from_fa(dfa)
+
+    assert d.size == len(dfa.states)
+    assert [d.states[i] for i in d.start] == list(dfa.start_states)
+    assert {d.states[i] for i in d.final} == set(dfa.final_states)
+
+    transitions = set()
+    for symb, m in d.matrices.items():
+        for s, f in zip(*m.nonzero()):
+            transitions.add((d.states[s], symb, d.states[f]))
+    assert transitions == set(dfa)
+    for s in dfa.states:
+        assert d.states[d.indices[s]] == s
+
+
+def test_intersect_bool_decompositions():
+    fa1 = fa_utils.build_DFA_from_regexp("a b*")
+    fa2 = fa_utils.build_DFA_from_regexp("a* b")
+    d1 = fa_utils.BoolDecomposition.from_fa(fa1)
+    d2 = fa_utils.BoolDecomposition.from_fa(fa2)
+    di = fa_utils.intersect_bool_decompositions(d1, d2)
+
+    assert di.size == d1.size * d2.size
+    assert {di.states[i] for i in di.start} == {
+        (s1, s2) for s1 in fa1.start_states for s2 in fa2.start_states
+    }
+    assert {di.states[i] for i in di.final} == {
+        (f1, f2) for f1 in fa1.final_states for f2 in fa2.final_states
+    }
+
+
+def test_query_graph_with_regexp_cycles():
+    graph = nx.MultiDiGraph()
+    graph.add_edge(0, 1, label="a")
+    graph.add_edge(1, 2, label="b")
+    graph.add_edge(2, 1, label="b")
+    graph.add_edge(2, 3, label="a")
+
+    result = fa_utils.query_graph_with_regexp(graph, {0, 1}, {1, 2, 3}, "a b b*")
+    assert set(result) == {(0, 1), (0, 2)}
+
+    result = fa_utils.query_graph_with_regexp(graph, {0, 1}, {3}, "a* b* a")
+    assert set(result) == {(0, 3), (1, 3)}
+
+
+def test_lazy_intersect_fa():
+    graph = nx.MultiDiGraph()
+    graph.add_edge(0, 1, label="a")
+    graph.add_edge(1, 2, label="b")
+    graph.add_edge(2, 1, label="b")
+    graph.add_edge(2, 3, label="a")
+    fa1 = fa_utils.build_NDFA_from_graph(graph)
+    fa2 = fa_utils.build_DFA_from_regexp("a b* a")
+
+    lazy = fa_utils.intersect_FA(fa1, fa2, lazy=True)
+    materialized = fa_utils.intersect_bool_decompositions(
+        fa_utils.BoolDecomposition.from_fa(fa1),
+        fa_utils.BoolDecomposition.from_fa(fa2),
+    )
+
+    assert lazy.size == materialized.size
+    assert set(lazy.start) == set(materialized.start)
+    assert set(lazy.final) == set(materialized.final)
+    for i in range(lazy.size):
+        assert lazy.state(i) == materialized.state(i)
+
+    front = csr_matrix(np.eye(lazy.size, dtype=bool))
+    assert (lazy.successors(front) != materialized.successors(front)).nnz == 0
+
+
+def test_nodes_accesible_with_regexp_constraint_multiple_source():
+    graph = nx.MultiDiGraph()
+    graph.add_edge(0, 1, label="a")
+    graph.add_edge(1, 2, label="b")
+    graph.add_edge(2, 1, label="b")
+    graph.add_edge(2, 3, label="a")
+    graph.add_edge(3, 0, label="a")
+
+    result = fa_utils.nodes_accesible_with_regexp_constraint(
+        {0, 2, 3}, graph, "a b*", separate_for_nodes=True
+    )
+    assert result == {0: {1, 2}, 2: {3}, 3: {0}}
+
+    result = fa_utils.nodes_accesible_with_regexp_constraint({0, 2, 3}, graph, "a b*")
+    assert result == {frozenset({0, 2, 3}): {0, 1, 2, 3}}
+
+
+def test_regex_cache():
+    cache = fa_utils.RegexCache(maxsize=1)
+
+    dfa, d = cache.get("a b*")
+    assert dfa.accepts("abb")
+    assert d.size == len(dfa.states)
+    assert cache.get("a b*") == (dfa, d)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    python_dfa, _ = cache.get("a b*", "python")
+    assert python_dfa.accepts("a bbb")
+    assert not python_dfa.accepts("abb")
+    assert cache.get("a b*")[0] is not dfa
+    assert (cache.hits, cache.misses) == (1, 3)
+
+
+def test_build_dfa_returns_copy():
+    graph = nx.MultiDiGraph()
+    graph.add_edge(0, 1, label="a")
+    graph.add_edge(1, 2, label="b")
+
+    dfa = fa_utils.build_DFA_from_regexp("a b")
+    dfa.add_transition(State("x"), "c", State("y"))
+    for s in list(dfa.states):
+        dfa.add_final_state(s)
+    python_dfa = fa_utils.build_DFA_from_python_regexp("ab")
+    python_dfa.add_final_state(list(python_dfa.start_states)[0])
+
+    fresh = fa_utils.build_DFA_from_regexp("a b")
+    assert not fresh.accepts(["a"]) and "c" not in fresh.symbols
+    assert not fa_utils.build_DFA_from_python_regexp("ab").accepts("")
+    assert set(fa_utils.query_graph_with_regexp(graph, {0}, None, "a b")) == {(0, 2)}
+    assert fa_utils.bfs_query_graph_with_regexp(graph, {0}, None, "a b") == [(0, 2)]
+
+
+def test_graph_index():
+    graph = nx.MultiDiGraph()
+    graph.add_edge(0, 1, label="a")
+    graph.add_edge(1, 2, label="b")
+    index = fa_utils.GraphIndex(graph)
+
+    decomposition = index.decomposition
+    assert index.decomposition is decomposition
+    assert set(index.nodes_index) == {0, 1, 2}
+
+    assert set(fa_utils.query_graph_with_regexp(index, {0}, {2}, "a b")) == {(0, 2)}
+    assert set(fa_utils.bfs_query_graph_with_regexp(index, {0}, {2}, "a b")) == {(0, 2)}
+
+    graph.add_edge(2, 3, label="a")
+    assert index.decomposition is not decomposition
+    assert set(fa_utils.bfs_query_graph_with_regexp(index, {0}, {3}, "a b a")) == {
+        (0, 3)
+    }
+
+    decomposition = index.decomposition
+    index.invalidate()
+    assert index.decomposition is not decomposition
+
+
+def test_bool_decomposition_from_graph():
+    graph = nx.MultiDiGraph()
+    graph.add_edge("x", "y", label="a")
+    graph.add_edge("y", "z", label="b")
+    graph.add_edge("y", "x", label="a")
+
+    d = fa_utils.BoolDecomposition.from_graph(graph, start={"x"}, final={"y", "z"})
+    expected = fa_utils.BoolDecomposition.from_fa(fa_utils.build_NDFA_from_graph(graph))
+
+    assert d.size == 3
+    assert [d.states[i] for i in d.start] == ["x"]
+    assert {d.states[i] for i in d.final} == {"y", "z"}
+    for symb, m in expected.matrices.items():
+        edges = {
+            (d.states[s], d.states[f]) for s, f in zip(*d.matrices[symb].nonzero())
+        }
+        assert edges == {
+            (expected.states[s], expected.states[f]) for s, f in zip(*m.nonzero())
+        }
+
+
+def test_query_graph_with_regexps():
+    graph = nx.MultiDiGraph()
+    graph.add_edge(0, 1, label="a")
+    graph.add_edge(1, 2, label="b")
+    graph.add_edge(2, 0, label="a")
+    graph.add_edge(2, 3, label="c")
+
+    regexps = ["a b", "(a b a)*", "c", "a b c"]
+    result = fa_utils.query_graph_with_regexps(graph, {0, 1, 2}, {0, 1, 2, 3}, regexps)
+
+    assert set(result) == set(regexps)
+    for regexp in regexps:
+        assert set(result[regexp]) == set(
+            fa_utils.bfs_query_graph_with_regexp(graph, {0, 1, 2}, {0, 1, 2, 3}, regexp)
+        )
+    assert set(result["a b"]) == {(0, 2)}
+    assert set(result["c"]) == {(2, 3)}
+    assert set(result["a b c"]) == {(0, 3)}
+
+
+def test_save_load_bool_decomposition(tmp_path):
+    graph = nx.MultiDiGraph()
+    graph.add_edge("x", "y", label="a")
+    graph.add_edge("y", "z", label="b")
+    graph.add_edge("y", "x", label="a")
+    graph.add_edge("z", "z", label="c")
+
+    path = str(tmp_path / "graph.bdec")
+    fa_utils.save_bool_decomposition(fa_utils.BoolDecomposition.from_graph(graph), path)
+    d = fa_utils.load_bool_decomposition(path)
+
+    assert d.states == ["x", "y", "z"]
+    assert set(d.matrices.keys()) == {"a", "b", "c"}
+    assert len(d.matrices._matrices) == 0
+    assert set(fa_utils.query_graph_with_regexp(d, {"x"}, None, "a b")) == {("x", "z")}
+    assert set(d.matrices._matrices) == {"a", "b"}
+    assert set(fa_utils.bfs_query_graph_with_regexp(d, {"x"}, {"x"}, "a a")) == {
+        ("x", "x")
+    }
+
+    for symb, m in fa_utils.BoolDecomposition.from_graph(graph).matrices.items():
+        assert (d.matrices[symb] != m).nnz == 0
+
+
+def test_iter_query_graph_with_regexp():
+    graph = nx.MultiDiGraph()
+    nx.add_path(graph, range(6), label="a")
+    graph.add_edge(5, 0, label="b")
+
+    pairs = fa_utils.iter_query_graph_with_regexp(graph, {0}, None, "a*")
+    assert next(pairs) == (0, 0)
+    assert next(pairs) == (0, 1)
+    assert list(pairs) == [(0, 2), (0, 3), (0, 4), (0, 5)]
+
+    assert fa_utils.bfs_query_graph_with_regexp(graph, {0}, None, "a*", limit=2) == [
+        (0, 0),
+        (0, 1),
+    ]
+    assert len(fa_utils.bfs_query_graph_with_regexp(graph, None, None, "a* b")) == 6
+
+
+def test_exists_path():
+    graph = nx.MultiDiGraph()
+    nx.add_path(graph, range(6), label="a")
+    graph.add_edge(5, 0, label="b")
+
+    assert fa_utils.exists_path(graph, 0, 5, "a*")
+    assert fa_utils.exists_path(graph, 3, 3, "a*")
+    assert fa_utils.exists_path(graph, 3, 1, "a* b a")
+    assert not fa_utils.exists_path(graph, 3, 1, "a*")
+    assert not fa_utils.exists_path(graph, 0, 6, "a*")
+
+
+def test_intersect_fa_keeps_state_pairs():
+    graph = nx.MultiDiGraph()
+    nx.add_path(graph, [0, 1, 2], label="a")
+    graph.add_edge(2, 0, label="b")
+    fa1 = fa_utils.build_NDFA_from_graph(graph, {0}, {2})
+    fa2 = Regex("a a (b a a)*").to_epsilon_nfa()
+
+    fai = fa_utils.intersect_FA(fa1, fa2)
+
+    assert fai.is_equivalent_to(fa1.get_intersection(fa2))
+    assert {s.value[0] for s in fai.start_states} == {0}
+    assert {s.value[0] for s in fai.final_states} == {2}
+    assert {s.value[0] for s in fai.states} == {0, 1, 2}
+    assert {s.value[1] for s in fai.states} <= set(fa2.states)
+
+
+def test_intersect_fa_reachable_states_only():
+    graph = nx.MultiDiGraph()
+    nx.add_path(graph, [0, 1, 2], label="a")
+    nx.add_path(graph, [3, 4, 5], label="a")
+    fa1 = fa_utils.build_NDFA_from_graph(graph, {0}, {2, 5})
+    fa2 = Regex("a a").to_epsilon_nfa()
+
+    fai = fa_utils.intersect_FA(fa1, fa2)
+
+    assert fai.is_equivalent_to(fa1.get_intersection(fa2))
+    assert {s.value[0] for s in fai.states} == {0, 1, 2}
+    assert {s.value[0] for s in fai.final_states} == {2}
+
+
+def test_query_graph_with_regexp_all_starts():
+    graph = nx.MultiDiGraph()
+    nx.add_cycle(graph, range(200), label="a")
+    nx.add_path(graph, range(0, 200, 7), label="b")
+
+    result = fa_utils.query_graph_with_regexp(graph, None, None, "a b a")
+    assert set(result) == set(
+        fa_utils.bfs_query_graph_with_regexp(graph, None, None, "a b a")
+    )
+    assert (6, 15) in result and len(result) == 28
@@ -1,5 +1,7 @@
 import pytest
 import pydot
+import cfpq_data
+import networkx as nx
 import project.graph_utils as utils
 
 
@@ -49,3 +51,92 @@ def test_save_labeled_two_cycle_graph():
     pd_graph = pydot.graph_from_dot_file(PATH + "2")[0]
     assert len(pd_graph.get_nodes()) - 1 == graph.number_of_nodes()
     assert len(pd_graph.get_edges()) == graph.number_of_edges()
+
+
+def test_read_graph(tmp_path):
+    graph = cfpq_data.labeled_two_cycles_graph(3, 2, labels=("a", "label b"))
+    nx.drawing.nx_pydot.write_dot(graph, tmp_path / "graph.dot")
+    with open(tmp_path / "graph.csv", "w") as f:
+        for v, u, label in graph.edges(data="label"):
+            f.write(f"{v} {u} {label}\n")
+
+    for name in ("graph.dot", "graph.csv"):
+        read = utils.read_graph(str(tmp_path / name))
+        assert set(read.nodes) == set(graph.nodes)
+        assert sorted(read.edges(data="label")) == sorted(graph.edges(data="label"))
+
+
+def test_graph_store(tmp_path):
+    path = str(tmp_path / "graph.csv")
+    with open(path, "w") as f:
+        f.write("0 1 a\n1,2,b\n\n# comment\n2 0 a\n")
+
+    store = utils.GraphStore(str(tmp_path / "store"))
+    index = store.get(path)
+    assert store.get(path) is index
+    assert sorted(index.graph.edges(data="label")) == [
+        (0, 1, "a"),
+        (1, 2, "b"),
+        (2, 0, "a"),
+    ]
+
+    other = utils.GraphStore(str(tmp_path / "store"))
+    assert sorted(other.get(path).graph.edges(data="label")) == sorted(
+        index.graph.edges(data="label")
+    )
+    assert (other.hits, other.misses) == (1, 0)
+
+
+def test_read_edge_list_without_labels(tmp_path):
+    path = tmp_path / "graph.txt"
+    path.write_text("0 1 a\n1 2\n")
+    graph = utils.read_edge_list(str(path))
+    assert set(graph.edges(data="label")) == {(0, 1, "a"), (1, 2, None)}
+
+    path.write_text("0 1 a\n\n2\n")
+    with pytest.raises(Exception, match="line 3"):
+        utils.read_edge_list(str(path))
+
+
+def test_read_dot_quoted(tmp_path):
+    path = tmp_path / "graph.dot"
+    path.write_text(
+        "digraph {\n"
+        'node [shape="box"];\n'
+        '"a b";\n'
+        '"a b" -> "c, d" [key=0, label="x, ]y"];\n'
+        '"c, d" -> 1 [label="say \\"hi\\""];\n'
+        "}\n"
+    )
+    graph = utils.read_dot(str(path))
+    assert set(graph.nodes) == {"a b", "c, d", 1}
+    assert set(graph.edges(data="label")) == {
+        ("a b", "c, d", "x, ]y"),
+        ("c, d", 1, 'say "hi"'),
+    }
+
+    path.write_text('digraph {\n0 -> 1 -> 2 [label="a"];\n"x" -> y [\nlabel=b];\n}\n')
+    graph = utils.read_dot(str(path))
+    assert set(graph.edges(data="label")) == {(0, 1, "a"), (1, 2, "a"), ("x", "y", "b")}
+
+
+def test_read_dot_comments(tmp_path):
+    path = tmp_path / "graph.dot"
+    path.write_text("digraph {\n0 -> 2;\n/*\n1 -> 2 [label=y];\n*/\n}\n")
+    assert set(utils.read_dot(str(path)).edges(data="label")) == {(0, 2, None)}
+
+    path.write_text(
+        "# 0 -> 9\n"
+        "digraph {\n"
+        '0 -> 2 [label="http://a/*b*/"]; // 2 -> 3 [label=z]\n'
+        "/* one */ 2 -> 0 [label=b]; /* two\n"
+        "0 -> 3;\n"
+        "*/\n"
+        "}\n"
+    )
+    graph = utils.read_dot(str(path))
+    assert set(graph.nodes) == {0, 2}
+    assert set(graph.edges(data="label")) == {(0, 2, "http://a/*b*/"), (2, 0, "b")}
+
+    path.write_text("digraph {\n0 [\nlabel=a];\n0 -> 1;\n}\n")
+    assert set(utils.read_dot(str(path)).nodes) == {0, 1}
@@ -1,6 +1,10 @@
 import io
 import sys
 
+import networkx as nx
+
+import project.graph_utils as graph_utils
+
 from project import Visitor
 from project.lang_utils import *
 
@@ -63,6 +67,7 @@ def run_visitor(code):
     visitor = Visitor()
 
     visitor.visit(tree)
+    return visitor
 
 
 def test_interpreter_basic():
@@ -116,3 +121,107 @@ def test_interpreter_start_final():
         assert len(result[1].strip()[1:-1].split(", ")) == 632
         assert result[2].strip() == "{1, 2, 3}"
         assert result[3].strip() == "{4, 5}"
+
+
+def test_interpreter_fused_intersect(monkeypatch):
+    graph = nx.MultiDiGraph()
+    nx.add_path(graph, [0, 1, 2, 3], label="a")
+    graph.add_edge(3, 0, label="b")
+    monkeypatch.setattr(graph_utils, "get_graph", lambda name: graph)
+    monkeypatch.setattr(graph_utils, "graph_store", graph_utils.GraphStore())
+
+    result = io.StringIO()
+    code = (
+        "g = load('graph').set_start({0});"
+        "r = g & (<a>:(<a>*));"
+        "print(r.get_start().map(s=>{{s.value[0]}}));"
+        "print(set(r.get_final().map(s=>{{s.value[0]}})));"
+    )
+    with result as sys.stdout:
+        run_visitor(code)
+        result = result.getvalue().splitlines()
+        assert result[0].strip() == "[0]"
+        assert result[1].strip() == "{1, 2, 3}"
+
+
+def test_interpreter_map_over_graph(monkeypatch):
+    graph = nx.MultiDiGraph()
+    nx.add_path(graph, [0, 1, 2], label="a")
+    graph.add_edge(2, 0, label="b")
+    monkeypatch.setattr(graph_utils, "get_graph", lambda name: graph)
+    monkeypatch.setattr(graph_utils, "graph_store", graph_utils.GraphStore())
+
+    result = io.StringIO()
+    code = (
+        "g = load('graph');"
+        "print(set(g.map(e=>{{e[1].value}})));"
+        "print(g.filter(e=>{{e[1].value == 'b'}}).map(e=>{{e[0].value}}));"
+    )
+    with result as sys.stdout:
+        run_visitor(code)
+        result = result.getvalue().splitlines()
+        assert result[0].strip() in {"{'a', 'b'}", "{'b', 'a'}"}
+        assert result[1].strip() == "[2]"
+
+
+def test_interpreter_get_reachable(monkeypatch):
+    graph = nx.MultiDiGraph()
+    nx.add_path(graph, [0, 1, 2], label="a")
+    graph.add_edge(3, 0, label="b")
+    monkeypatch.setattr(graph_utils, "get_graph", lambda name: graph)
+    monkeypatch.setattr(graph_utils, "graph_store", graph_utils.GraphStore())
+
+    result = io.StringIO()
+    code = (
+        "g = load('graph').set_start({0, 3}).set_final({2, 3});"
+        "print(set(g.get_reachable()));"
+        "print(g.get_reachable().filter(p=>{{p[0] == 3}}));"
+    )
+    with result as sys.stdout:
+        run_visitor(code)
+        result = result.getvalue().splitlines()
+        assert set(result[0].strip()[2:-2].split("), (")) == {"0, 2", "3, 2", "3, 3"}
+        assert set(result[1].strip()[2:-2].split("), (")) == {"3, 2", "3, 3"}
+
+
+def test_interpreter_lambda_stream():
+    result = io.StringIO()
+    code = (
+        "t = [1,2,3,4,5,6]; k = 1;"
+        "m = t.map(x=>{{x + k}}).filter(x=>{{x % 2 == 0}});"
+        "k = 10;"
+        "print(m); print(t.map(x=>{{x + k}}));"
+        "print(m.map(x=>{{x * x}}) : [0]);"
+    )
+    with result as sys.stdout:
+        visitor = run_visitor(code)
+        result = result.getvalue().splitlines()
+        assert result[0].strip() == "[2, 4, 6]"
+        assert result[1].strip() == "[11, 12, 13, 14, 15, 16]"
+        assert result[2].strip() == "[4, 16, 36, 0]"
+        assert len(visitor.lambdas) == 4
+
+
+def test_interpreter_lambda_comment():
+    result = io.StringIO()
+    with result as sys.stdout:
+        run_visitor("t = [1,2,3]; print(t.map(x=>{{x * 2 # double}}));")
+        assert result.getvalue().strip() == "[2, 4, 6]"
+
+
+def test_interpreter_load_local_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(graph_utils, "graph_store", graph_utils.GraphStore())
+    path = tmp_path / "graph.csv"
+    path.write_text("0 1 a\n1 2 b\n")
+
+    result = io.StringIO()
+    code = (
+        f"g = load('{path}'); h = load('{path}');"
+        "print(g.get_labels()); print(h.set_start({0}).set_final({2}).get_reachable());"
+    )
+    with result as sys.stdout:
+        run_visitor(code)
+        result = result.getvalue().splitlines()
+        assert result[0].strip() in {"{a, b}", "{b, a}"}
+        assert result[1].strip() == "[(0, 2)]"
+    assert graph_utils.graph_store.misses == 1